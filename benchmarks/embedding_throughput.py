@@ -0,0 +1,56 @@
+import time
+import argparse
+from openai import AsyncOpenAI
+from src.Common.embedding_pipeline import EmbeddingPipeline
+from benchmarks.fake_embedding_server import FakeEmbeddingServer
+
+
+def run_case(server, texts, batch_size, max_concurrency, requests_per_minute):
+    client = AsyncOpenAI(base_url=server.base_url, api_key="fake")
+    pipeline = EmbeddingPipeline(
+        batch_size=batch_size,
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        client=client,
+    )
+    start = time.perf_counter()
+    pipeline.embed(texts)
+    elapsed = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "max_concurrency": max_concurrency,
+        "seconds": round(elapsed, 3),
+        "texts_per_second": round(len(texts) / elapsed, 1),
+        "requests": pipeline.stats["requests"],
+        "rate_limited": pipeline.stats["rate_limited"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the embedding pipeline against a local fake endpoint"
+    )
+    parser.add_argument("--texts", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--server-requests-per-second", type=float, default=20.0)
+    parser.add_argument("--requests-per-minute", type=float, default=1200.0)
+    args = parser.parse_args()
+
+    server = FakeEmbeddingServer(
+        latency=args.latency, requests_per_second=args.server_requests_per_second
+    ).start()
+    texts = [f"profile chunk number {i}" for i in range(args.texts)]
+    try:
+        for batch_size in [1, 16, 64]:
+            for max_concurrency in [1, 4, 8]:
+                print(
+                    run_case(
+                        server,
+                        texts,
+                        batch_size,
+                        max_concurrency,
+                        args.requests_per_minute,
+                    )
+                )
+    finally:
+        server.stop()
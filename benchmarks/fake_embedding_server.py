@@ -0,0 +1,138 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeEmbeddingServer:
+    """
+    Local stand-in for an OpenAI-compatible `/embeddings` endpoint.
+
+    Vectors are derived from a hash of each input, so they are stable across runs.
+    Every request waits `latency` seconds plus `per_input_latency` per input, and
+    more than `requests_per_second` requests in a second get a 429 response with a
+    `Retry-After` header, like a rate limited hosted endpoint.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        dim=1536,
+        latency=0.05,
+        per_input_latency=0.001,
+        requests_per_second=20.0,
+    ):
+        self.dim = dim
+        self.latency = latency
+        self.per_input_latency = per_input_latency
+        self.requests_per_second = requests_per_second
+        self.stats = {"requests": 0, "inputs": 0, "rate_limited": 0}
+        self._window = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def _vector(self, text: str) -> list:
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+        rng = random.Random(seed)
+        return [rng.uniform(-1, 1) for _ in range(self.dim)]
+
+    def _rate_limited(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.requests_per_second:
+                self.stats["rate_limited"] += 1
+                return True
+            self._window.append(now)
+            self.stats["requests"] += 1
+            return False
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/embeddings"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                if server._rate_limited():
+                    self._send_json(
+                        429,
+                        {"error": {"message": "Rate limit exceeded"}},
+                        {"Retry-After": "1"},
+                    )
+                    return
+
+                inputs = request.get("input", [])
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                server.stats["inputs"] += len(inputs)
+                time.sleep(server.latency + server.per_input_latency * len(inputs))
+                self._send_json(
+                    200,
+                    {
+                        "object": "list",
+                        "model": request.get("model"),
+                        "data": [
+                            {
+                                "object": "embedding",
+                                "index": i,
+                                "embedding": server._vector(text),
+                            }
+                            for i, text in enumerate(inputs)
+                        ],
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    },
+                )
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake embeddings endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--requests-per-second", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server = FakeEmbeddingServer(
+        port=args.port,
+        latency=args.latency,
+        requests_per_second=args.requests_per_second,
+    )
+    print(f"Fake embeddings endpoint on {server.base_url}")
+    server._server.serve_forever()
@@ -0,0 +1,235 @@
+import json
+import time
+import argparse
+from benchmarks.fake_embedding_server import FakeEmbeddingServer
+from benchmarks.fake_tba_server import TEAM_NUMBER, EVENT_KEY
+
+# Arguments of the agent tool calls, by parameter name
+TOOL_ARGUMENTS = {
+    "team_id": TEAM_NUMBER,
+    "event_key": EVENT_KEY,
+    "match_key": f"{EVENT_KEY}_qm1",
+    "match_keys": [f"{EVENT_KEY}_qm1", f"{EVENT_KEY}_qm2"],
+}
+
+# Structured outputs (chat.completions.parse) by response format name
+STRUCTURED_RESPONSES = {
+    "SQLQueryOutput": {
+        "sql_query": "SELECT institution, COUNT(*) AS members FROM members "
+        "GROUP BY institution ORDER BY members DESC LIMIT 10",
+        "explanation": "Members per institution.",
+    },
+}
+
+FIGURE_CODE = """```python
+import plotly.graph_objects as go
+fig = go.Figure(data=[go.Bar(x=["a", "b", "c"], y=[3, 2, 1])])
+```"""
+
+KEYWORDS_RESPONSE = {
+    "high_level_keywords": ["career", "education"],
+    "low_level_keywords": ["member", "company"],
+}
+
+WORDS = "the member works as a software engineer and studied computer science at the university".split()
+
+
+def fill_schema(schema: dict, name: str = None):
+    # Smallest value of a JSON schema, using TOOL_ARGUMENTS where the name matches
+    if name in TOOL_ARGUMENTS:
+        return TOOL_ARGUMENTS[name]
+    kind = schema.get("type")
+    if kind == "object" or "properties" in schema:
+        return {key: fill_schema(value, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return []
+    if kind in ("integer", "number"):
+        return 1
+    if kind == "boolean":
+        return False
+    if "anyOf" in schema:
+        return fill_schema(schema["anyOf"][0], name)
+    return "benchmark"
+
+
+def count_tokens(text: str) -> int:
+    # One token per word, close enough for load generation
+    return max(1, len(text.split()))
+
+
+class FakeOpenAIServer(FakeEmbeddingServer):
+    """
+    Local stand-in for the OpenAI-compatible chat completions and embeddings
+    endpoints used by the parts.
+
+    `/chat/completions` waits `latency` seconds (time to first token) and then
+    generates `completion_tokens` tokens at `tokens_per_second`, streamed as
+    server-sent events when `stream` is set. The content depends on the request:
+    a `json_schema` response format gets `STRUCTURED_RESPONSES` (or the smallest
+    value of the schema), a request with tools and no tool results gets a call
+    of the first tool, a Plotly prompt gets figure code and LightRAG keyword
+    extraction gets a keywords JSON. Usage is reported in every response, and in
+    a last chunk of a stream when `stream_options.include_usage` is set.
+    `/embeddings` behaves like `FakeEmbeddingServer`.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.2,
+        tokens_per_second=200.0,
+        completion_tokens=60,
+        embedding_latency=0.05,
+        requests_per_second=1000.0,
+    ):
+        super().__init__(
+            host=host,
+            port=port,
+            latency=embedding_latency,
+            requests_per_second=requests_per_second,
+        )
+        self.chat_latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.stats.update({"chat_requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+
+    def _answer(self) -> str:
+        return " ".join(WORDS[i % len(WORDS)] for i in range(self.completion_tokens))
+
+    def reply(self, request: dict) -> dict:
+        messages = request.get("messages", [])
+        text = "\n".join(str(m.get("content") or "") for m in messages)
+        response_format = request.get("response_format") or {}
+
+        if response_format.get("type") == "json_schema":
+            json_schema = response_format["json_schema"]
+            content = STRUCTURED_RESPONSES.get(json_schema["name"]) or fill_schema(
+                json_schema.get("schema", {})
+            )
+            return {"role": "assistant", "content": json.dumps(content)}
+
+        tools = request.get("tools")
+        if tools and not any(m.get("role") == "tool" for m in messages):
+            function = tools[0]["function"]
+            arguments = fill_schema(function.get("parameters", {}))
+            return {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": "call_benchmark",
+                        "type": "function",
+                        "function": {"name": function["name"], "arguments": json.dumps(arguments)},
+                    }
+                ],
+            }
+
+        if "plotly" in text.lower():
+            return {"role": "assistant", "content": FIGURE_CODE}
+        if response_format.get("type") == "json_object":
+            content = KEYWORDS_RESPONSE if "keywords" in text.lower() else {}
+            return {"role": "assistant", "content": json.dumps(content)}
+        return {"role": "assistant", "content": self._answer()}
+
+    def _usage(self, request: dict, message: dict) -> dict:
+        prompt_tokens = count_tokens(
+            "".join(str(m.get("content") or "") for m in request.get("messages", []))
+        )
+        completion_tokens = count_tokens(
+            message.get("content") or json.dumps(message.get("tool_calls"))
+        )
+        self.stats["chat_requests"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    def _handler(self):
+        server = self
+        EmbeddingHandler = super()._handler()
+
+        class Handler(EmbeddingHandler):
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    super().do_POST()
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                message = server.reply(request)
+                usage = server._usage(request, message)
+                completion = {
+                    "id": "chatcmpl-benchmark",
+                    "created": int(time.time()),
+                    "model": request.get("model"),
+                }
+
+                time.sleep(server.chat_latency)
+                if request.get("stream"):
+                    include_usage = (request.get("stream_options") or {}).get("include_usage")
+                    self._stream(completion, message, usage if include_usage else None)
+                    return
+
+                time.sleep(usage["completion_tokens"] / server.tokens_per_second)
+                finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+                self._send_json(
+                    200,
+                    {
+                        **completion,
+                        "object": "chat.completion",
+                        "choices": [
+                            {"index": 0, "message": message, "finish_reason": finish_reason}
+                        ],
+                        "usage": usage,
+                    },
+                )
+
+            def _stream(self, completion, message, usage=None):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+
+                def send(delta, finish_reason=None):
+                    chunk = {
+                        **completion,
+                        "object": "chat.completion.chunk",
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                # One word per chunk, paced at the configured token rate
+                for word in (message.get("content") or "").split(" "):
+                    send({"content": word + " "})
+                    time.sleep(1 / server.tokens_per_second)
+                send({}, "stop")
+                if usage:
+                    # Like the OpenAI API, the usage comes last in a chunk without choices
+                    chunk = {**completion, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible endpoint")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        port=args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+    )
+    print(f"Fake OpenAI endpoint on {server.base_url} (set OPENAI_API_BASE to this URL)")
+    server._server.serve_forever()
@@ -0,0 +1,157 @@
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEAM_NUMBER = 5715
+EVENT_KEY = "2024cmptx"
+
+
+def make_match(match_number: int, finished: bool = True) -> dict:
+    key = f"{EVENT_KEY}_qm{match_number}"
+    red_auto, blue_auto = 10 + match_number, 8 + match_number
+    return {
+        "key": key,
+        "event_key": EVENT_KEY,
+        "comp_level": "qm",
+        "set_number": 1,
+        "match_number": match_number,
+        "time": 1713000000 + match_number * 600,
+        "actual_time": 1713000000 + match_number * 600 if finished else None,
+        "post_result_time": 1713000300 + match_number * 600 if finished else None,
+        "winning_alliance": "red" if finished else "",
+        "alliances": {
+            "red": {
+                "score": 60 + match_number if finished else -1,
+                "team_keys": [f"frc{TEAM_NUMBER}", "frc254", "frc1678"],
+                "surrogate_team_keys": [],
+                "dq_team_keys": [],
+            },
+            "blue": {
+                "score": 50 + match_number if finished else -1,
+                "team_keys": ["frc118", "frc2056", "frc971"],
+                "surrogate_team_keys": [],
+                "dq_team_keys": [],
+            },
+        },
+        "score_breakdown": {
+            alliance: {
+                "autoPoints": auto if finished else 0,
+                "teleopPoints": 40 if finished else 0,
+                "endGamePoints": 10 if finished else 0,
+                "foulPoints": 0,
+                "totalPoints": auto + 50 if finished else 0,
+                "autoLeavePoints": 6,
+                "autoSpeakerNotePoints": auto - 6,
+            }
+            for alliance, auto in [("red", red_auto), ("blue", blue_auto)]
+        },
+        "videos": [{"type": "youtube", "key": f"video{match_number}"}],
+    }
+
+
+def default_routes(matches: int = 12) -> dict:
+    routes = {
+        f"/team/frc{TEAM_NUMBER}/awards": [
+            {
+                "name": "Championship Winner",
+                "award_type": 1,
+                "event_key": EVENT_KEY,
+                "year": 2024,
+                "recipient_list": [{"team_key": f"frc{TEAM_NUMBER}", "awardee": None}],
+            }
+        ],
+        f"/team/frc{TEAM_NUMBER}/event/{EVENT_KEY}/matches": [
+            make_match(i) for i in range(1, matches + 1)
+        ],
+    }
+    for i in range(1, matches + 1):
+        routes[f"/match/{EVENT_KEY}_qm{i}"] = make_match(i)
+    return routes
+
+
+class FakeTBAServer:
+    """
+    Local stand-in for The Blue Alliance API v3.
+
+    Serves fixed JSON payloads under `/api/v3`, with an `ETag` per payload and
+    `Cache-Control: max-age`, and answers `If-None-Match` with 304. Every request
+    waits `latency` seconds.
+    """
+
+    def __init__(
+        self, host="127.0.0.1", port=0, routes=None, latency=0.05, max_age=60
+    ):
+        self.routes = routes or default_routes()
+        self.latency = latency
+        self.max_age = max_age
+        self.stats = {"requests": 0, "not_modified": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/v3"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server.stats["requests"] += 1
+                time.sleep(server.latency)
+                path = self.path.split("?")[0].removeprefix("/api/v3")
+                if path not in server.routes:
+                    body = json.dumps({"Errors": [{"path": "not found"}]}).encode()
+                    self.send_response(404)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                body = json.dumps(server.routes[path]).encode("utf-8")
+                etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    server.stats["not_modified"] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Cache-Control", f"max-age={server.max_age}")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", f"max-age={server.max_age}")
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake The Blue Alliance API")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = FakeTBAServer(port=args.port, latency=args.latency)
+    print(f"Fake TBA API on {server.base_url} (set TBA_API_BASE to this URL)")
+    server._server.serve_forever()
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+from nano_vectordb import NanoVectorDB
+from src.Part3_GraphRAG.memmap_vector_storage import (
+    normalize,
+    storage_paths,
+    migrate_from_json,
+)
+
+# Compares the NanoVectorDB JSON files of the GraphRAG working dir with their
+# memory-mapped copies: load time, Python heap after loading and top-k latency.
+# The migration is written to a temp dir, the working dir is not changed.
+
+source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKING_DIR = os.path.join(source_dir, "data/lightrag_storage/")
+
+
+def measure_load(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = load()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, seconds, peak
+
+
+def measure_queries(query, queries: np.ndarray, top_k: int) -> tuple:
+    latencies = []
+    for embedding in queries:
+        start = time.perf_counter()
+        query(embedding, top_k)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95) - 1]
+
+
+def memmap_query(matrix: np.ndarray, records: list):
+    def query(embedding, top_k):
+        scores = matrix @ normalize(embedding)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        return [records[i] for i in top[np.argsort(-scores[top])]]
+
+    return query
+
+
+def run_namespace(namespace: str, temp_dir: str, queries: int, top_k: int):
+    _, _, json_path = storage_paths(WORKING_DIR, namespace)
+    vectors_path, meta_path, _ = storage_paths(temp_dir, namespace)
+    migrate_from_json(json_path, vectors_path, meta_path)
+
+    nano, nano_seconds, nano_peak = measure_load(
+        lambda: NanoVectorDB(1536, storage_file=json_path)
+    )
+
+    def load_memmap():
+        with open(meta_path, "r", encoding="utf-8") as file:
+            records = json.load(file)["data"]
+        return np.load(vectors_path, mmap_mode="r"), records
+
+    (matrix, records), memmap_seconds, memmap_peak = measure_load(load_memmap)
+
+    top_k = min(top_k, len(records))
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((queries, matrix.shape[1])).astype(np.float32)
+    nano_p50, nano_p95 = measure_queries(
+        lambda e, k: nano.query(e, top_k=k, better_than_threshold=-1.0), embeddings, top_k
+    )
+    memmap_p50, memmap_p95 = measure_queries(
+        memmap_query(matrix, records), embeddings, top_k
+    )
+
+    for storage, seconds, peak, p50, p95, size in [
+        ("json", nano_seconds, nano_peak, nano_p50, nano_p95, os.path.getsize(json_path)),
+        (
+            "memmap",
+            memmap_seconds,
+            memmap_peak,
+            memmap_p50,
+            memmap_p95,
+            os.path.getsize(vectors_path) + os.path.getsize(meta_path),
+        ),
+    ]:
+        print(
+            {
+                "namespace": namespace,
+                "storage": storage,
+                "vectors": len(records),
+                "disk_kb": round(size / 1024),
+                "load_ms": round(seconds * 1000, 1),
+                "heap_peak_kb": round(peak / 1024),
+                "query_p50_ms": round(p50 * 1000, 3),
+                "query_p95_ms": round(p95 * 1000, 3),
+            }
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the JSON and memory-mapped GraphRAG vector storages"
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for namespace in ["entities", "relationships", "chunks"]:
+            run_namespace(namespace, temp_dir, args.queries, args.top_k)
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+# Measures the cold import of the Chainlit app and of the part behind each chat
+# profile, each in a fresh interpreter with `python -X importtime`, and lists the
+# packages that cost the most. This is the time a restarted worker or a new pod
+# spends before it can answer the first question of that profile.
+
+source_dir = Path(__file__).resolve().parent.parent
+
+MODULES = {
+    "app": "src.Chainlit_App.chat_app",
+    "simple": "src.Part1_Simple_LLM.simple_llm_chat",
+    "rag": "src.Part2_RAG.rag_chat",
+    "graphrag": "src.Part3_GraphRAG.graphrag_chat",
+    "text2sql": "src.Part4_Text2SQL.text_to_sql_chat",
+    "frc": "src.Part5_Agent.frc_agent",
+}
+
+
+def parse_importtime(stderr: str) -> list:
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|", 2)
+        imports.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return imports
+
+
+def run_importtime(code: str):
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=source_dir,
+        env={**os.environ, "PYTHONPATH": str(source_dir)},
+        capture_output=True,
+        text=True,
+    )
+
+
+def measure(module: str, startup: set) -> dict:
+    result = run_importtime(f"import {module}")
+    # Leave out what the interpreter imports before running any code
+    imports = [item for item in parse_importtime(result.stderr) if item["module"] not in startup]
+    error = None
+    if result.returncode != 0:
+        output = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        error = output[-1][:200] if output else "unknown error"
+
+    # Top-level packages by the time spent in their own modules
+    packages = {}
+    for item in imports:
+        package = item["module"].split(".")[0]
+        packages[package] = packages.get(package, 0) + item["self_ms"]
+    return {
+        "module": module,
+        "total_ms": round(sum(item["cumulative_ms"] for item in imports if item["depth"] == 0), 1),
+        "modules": len(imports),
+        "packages": sorted(packages.items(), key=lambda item: item[1], reverse=True),
+        "error": error,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the cold import time of the Chainlit app and of each chat profile"
+    )
+    parser.add_argument("--profiles", nargs="+", choices=list(MODULES), default=list(MODULES))
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    startup = {item["module"] for item in parse_importtime(run_importtime("pass").stderr)}
+    reports = {profile: measure(MODULES[profile], startup) for profile in args.profiles}
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for profile, report in reports.items():
+            print(
+                f"\n⏱️ {profile} ({report['module']}): {report['total_ms']:.0f} ms, "
+                f"{report['modules']} modules"
+            )
+            if report["error"]:
+                print(f"  ❌ {report['error']}")
+            for package, ms in report["packages"][: args.top]:
+                print(f"  {package:<24} {ms:>9.1f} ms")
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from benchmarks.fake_tba_server import FakeTBAServer
+from src.Common.tracing import percentile
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Drives the five parts against local stand-ins of the OpenAI-compatible API and
+# The Blue Alliance API at set concurrency levels, and reports throughput, tail
+# latency and memory. Every run is appended to RESULTS_PATH and compared with the
+# previous run of the same case. The parts are imported only after the servers
+# are up, since the shared clients read OPENAI_API_BASE and TBA_API_BASE then.
+
+source_dir = Path(__file__).resolve().parent.parent
+RESULTS_PATH = source_dir / "benchmarks" / "results" / "parts_benchmark.jsonl"
+
+PROFILES = ["simple", "rag", "graphrag", "text2sql", "frc"]
+QUESTIONS = {
+    "simple": "what the community trying to empower?",
+    "rag": "where nadeem azaizah currently working?",
+    "graphrag": "where nadeem azaizah currently working?",
+    "text2sql": "how many members per institution?",
+    "frc": "How many awards did team 5715 win?",
+}
+
+
+def configure(openai_server: FakeOpenAIServer, tba_server: FakeTBAServer):
+    # Environment variables win over .env, load_dotenv does not override them
+    os.environ["OPENAI_API_BASE"] = openai_server.base_url
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["TBA_API_BASE"] = tba_server.base_url
+    os.environ["TBA_KEY"] = "benchmark"
+    # Measure the pipelines, not the local caches of earlier answers
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    os.environ["SQL_ROUTER_ENABLED"] = "false"
+
+
+async def ask_simple(question: str):
+    from src.Part1_Simple_LLM.simple_llm_chat import arun_chat
+
+    return await arun_chat(question)
+
+
+async def ask_rag(question: str):
+    from src.Part2_RAG.rag_chat import arun_chat
+
+    return await arun_chat(question)
+
+
+async def ask_graphrag(question: str):
+    from src.Part3_GraphRAG.graphrag_chat import arun_chat
+
+    return await arun_chat(question)
+
+
+async def ask_text2sql(question: str):
+    # The chain of the Chainlit app: SQL, then the answer and the chart together
+    from src.Part4_Text2SQL.text_to_sql_chat import (
+        awrite_and_run_sql_query,
+        write_answer_and_figure,
+        results_context,
+    )
+
+    _, query_results = await awrite_and_run_sql_query(question)
+    if isinstance(query_results, str):
+        return query_results
+    context = results_context(query_results)
+    results = dict([item async for item in write_answer_and_figure(question, context, query_results)])
+    return results["answer"]
+
+
+async def ask_frc(question: str):
+    from src.Part5_Agent.frc_agent import arun_frc_agent
+
+    result = await arun_frc_agent(question)
+    return result.final_output
+
+
+ASK = {
+    "simple": ask_simple,
+    "rag": ask_rag,
+    "graphrag": ask_graphrag,
+    "text2sql": ask_text2sql,
+    "frc": ask_frc,
+}
+
+
+def rss_mb() -> float:
+    # Current resident set size where /proc is available, else the peak
+    try:
+        with open("/proc/self/statm", "r") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if os.uname().sysname == "Darwin" else peak / 2**10
+
+
+async def timed_ask(ask, question: str):
+    # Returns the latency and the error, the parts return their errors as answers
+    start = time.perf_counter()
+    try:
+        answer = await ask(question)
+        failed = isinstance(answer, str) and answer.startswith(("Error", "Query rejected"))
+        error = answer if failed else None
+    except Exception as e:
+        error = f"Error: {str(e)}"
+    return time.perf_counter() - start, error
+
+
+async def run_level(ask, question: str, concurrency: int, requests: int) -> dict:
+    latencies, errors = [], 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            seconds, error = await timed_ask(ask, question)
+            latencies.append(seconds)
+            errors += error is not None
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "errors": errors,
+        "rss_mb": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=source_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(results_path: Path) -> list:
+    if not results_path.exists():
+        return []
+    with open(results_path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare(record: dict, history: list) -> str:
+    # Against the latest earlier run of the same case and server settings
+    previous = [
+        r
+        for r in history
+        if r["profile"] == record["profile"]
+        and r["concurrency"] == record["concurrency"]
+        and r["server"] == record["server"]
+    ]
+    if not previous:
+        return "no earlier run to compare with"
+    last = previous[-1]
+
+    def change(key):
+        return (record[key] - last[key]) / last[key] * 100 if last[key] else 0.0
+
+    return (
+        f"vs {last['run']} ({last['commit']}): throughput {change('throughput_rps'):+.0f}%, "
+        f"p95 {change('p95_ms'):+.0f}%, rss {change('rss_mb'):+.0f}%"
+    )
+
+
+async def run_benchmark(args, server_settings: dict, history: list):
+    # Returns the records and the profiles skipped because their first question failed
+    records, skipped = [], {}
+    run = time.strftime("%Y-%m-%dT%H:%M:%S")
+    commit = git_commit()
+    try:
+        for profile in args.profiles:
+            ask, question = ASK[profile], QUESTIONS[profile]
+            if profile == "frc":
+                # A fresh response cache per run, the fake API payloads are not kept
+                from src.Part5_Agent.tba_client import async_tba_client, TBAResponseCache
+
+                async_tba_client.cache = TBAResponseCache(
+                    os.path.join(args.temp_dir, "tba_cache.db")
+                )
+
+            # The first question imports the part and opens its indexes
+            cold_seconds, error = await timed_ask(ask, question)
+            if error:
+                skipped[profile] = error[:300]
+                print({"profile": profile, "skipped": skipped[profile]})
+                continue
+            for concurrency in args.concurrency:
+                record = {
+                    "run": run,
+                    "commit": commit,
+                    "profile": profile,
+                    "concurrency": concurrency,
+                    "requests": args.requests,
+                    "server": server_settings,
+                    "cold_ms": round(cold_seconds * 1000, 1),
+                    **await run_level(ask, question, concurrency, args.requests),
+                }
+                print({k: v for k, v in record.items() if k not in ("run", "commit", "server")})
+                print(f"  {compare(record, history)}")
+                records.append(record)
+    finally:
+        if "graphrag" in args.profiles:
+            from src.Part3_GraphRAG.graphrag_chat import stop_graphrag
+
+            await stop_graphrag()
+    return records, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parts against local fake OpenAI and TBA servers"
+    )
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=PROFILES)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--tba-latency", type=float, default=0.05)
+    parser.add_argument("--results", default=str(RESULTS_PATH))
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    server_settings = {
+        "latency": args.latency,
+        "tokens_per_second": args.tokens_per_second,
+        "completion_tokens": args.completion_tokens,
+        "embedding_latency": args.embedding_latency,
+        "tba_latency": args.tba_latency,
+    }
+    openai_server = FakeOpenAIServer(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        embedding_latency=args.embedding_latency,
+    ).start()
+    tba_server = FakeTBAServer(latency=args.tba_latency).start()
+    configure(openai_server, tba_server)
+
+    results_path = Path(args.results)
+    history = load_history(results_path)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            args.temp_dir = temp_dir
+            records, skipped = asyncio.run(run_benchmark(args, server_settings, history))
+    finally:
+        openai_server.stop()
+        tba_server.stop()
+
+    print(f"Fake OpenAI server: {openai_server.stats}")
+    if records and not args.no_save:
+        results_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(results_path, "a", encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        print(f"Results appended to {results_path}")
+    if skipped:
+        print(f"Skipped profiles: {', '.join(skipped)}")
+    if not records:
+        print("❌ Every profile was skipped, nothing was measured")
+        sys.exit(1)
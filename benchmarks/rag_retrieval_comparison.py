@@ -0,0 +1,62 @@
+import time
+import argparse
+import statistics
+from src.Part2_RAG.rag_chat import load_index
+from src.Part2_RAG.rag_indexing import DATA_DIRECTORY_PATH
+from src.Part2_RAG.hybrid_retriever import RETRIEVAL_MODES
+
+# Compares the retrieval modes on the profiles corpus. Needs the LanceDB index
+# built by rag_indexing and the embedding endpoint configured in .env.
+
+QUESTION_TEMPLATES = [
+    "where {name} currently working?",
+    "what is the education of {name}?",
+    "which skills does {name} have?",
+]
+
+
+def load_questions() -> list:
+    # Each profile starts with "<Person First Last", the profile file is the
+    # relevant document of the questions about that person
+    questions = []
+    for path in sorted(DATA_DIRECTORY_PATH.glob("*.txt")):
+        with open(path, "r", encoding="utf-8") as file:
+            first_line = file.readline().strip()
+        name = first_line.removeprefix("<Person").strip().lower()
+        for template in QUESTION_TEMPLATES:
+            questions.append((template.format(name=name), path.name))
+    return questions
+
+
+def run_mode(retriever, questions: list, mode: str) -> dict:
+    latencies, hits, precisions = [], 0, []
+    for question, relevant_doc in questions:
+        start = time.perf_counter()
+        nodes = retriever.retrieve(question, mode=mode)
+        latencies.append(time.perf_counter() - start)
+        relevant = [n for n in nodes if n.node.ref_doc_id == relevant_doc]
+        hits += bool(relevant)
+        precisions.append(len(relevant) / len(nodes) if nodes else 0.0)
+    latencies.sort()
+    return {
+        "mode": mode,
+        "questions": len(questions),
+        "recall@3": round(hits / len(questions), 3),
+        "precision@3": round(statistics.mean(precisions), 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare vector, BM25, hybrid and auto retrieval on the profiles"
+    )
+    parser.add_argument("--modes", nargs="+", default=RETRIEVAL_MODES)
+    args = parser.parse_args()
+
+    retriever = load_index()
+    questions = load_questions()
+    for mode in args.modes:
+        print(run_mode(retriever, questions, mode))
+    print(f"📊 Retrieval paths: {retriever.stats}")
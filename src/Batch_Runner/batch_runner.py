@@ -0,0 +1,237 @@
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from src.Common.llm_clients import usage_scope
+from src.Common.tracing import tracer, span, trace_profile, percentile
+
+# Runs a JSONL file of questions ({"id": ..., "question": ...} per line) through
+# one of the assistants and appends one result per line to the output JSONL as
+# soon as it is ready. Items already answered in the output file are skipped, so
+# an interrupted batch is resumed by running the same command again.
+
+PROFILES = ["simple", "rag", "graphrag", "text2sql", "frc"]
+BATCH_CONCURRENCY = 4
+
+
+async def ask_simple(question: str) -> dict:
+    from src.Part1_Simple_LLM.simple_llm_chat import arun_chat
+
+    return {"answer": await arun_chat(question)}
+
+
+async def ask_rag(question: str) -> dict:
+    from src.Part2_RAG.rag_chat import arun_chat
+
+    return {"answer": await arun_chat(question)}
+
+
+async def ask_graphrag(question: str) -> dict:
+    from src.Part3_GraphRAG.graphrag_chat import arun_chat
+
+    return {"answer": await arun_chat(question)}
+
+
+async def ask_text2sql(question: str) -> dict:
+    from src.Part4_Text2SQL.text_to_sql_chat import (
+        awrite_and_run_sql_query,
+        awrite_answer,
+        results_context,
+    )
+
+    sql_query_result, query_results = await awrite_and_run_sql_query(question)
+    if isinstance(query_results, str):
+        # Rejected or failing query after all the attempts
+        raise RuntimeError(query_results)
+    return {
+        "answer": await awrite_answer(question, results_context(query_results)),
+        "sql_query": sql_query_result.sql_query,
+        "rows": len(query_results),
+    }
+
+
+async def ask_frc(question: str) -> dict:
+    from src.Part5_Agent.frc_agent import arun_frc_agent
+
+    result = await arun_frc_agent(question)
+    # The agents SDK has its own usage counters, cached answers have none
+    wrapper = getattr(result, "context_wrapper", None)
+    if wrapper is None:
+        return {"answer": result.final_output}
+    usage = wrapper.usage
+    details = getattr(usage, "input_tokens_details", None)
+    return {
+        "answer": result.final_output,
+        "agent_usage": {
+            "requests": usage.requests,
+            "prompt_tokens": usage.input_tokens,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+            "completion_tokens": usage.output_tokens,
+        },
+    }
+
+
+ASK = {
+    "simple": ask_simple,
+    "rag": ask_rag,
+    "graphrag": ask_graphrag,
+    "text2sql": ask_text2sql,
+    "frc": ask_frc,
+}
+
+
+def load_questions(input_path: str) -> list:
+    items = []
+    with open(input_path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            # Items without an id are identified by their line in the file
+            items.append({"id": str(item.get("id", line_number)), "question": item["question"]})
+    return items
+
+
+def load_answered(output_path: str) -> set:
+    # Ids with a successful result; failed items are asked again on resume
+    answered = set()
+    if not Path(output_path).exists():
+        return answered
+    with open(output_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run that was killed while writing
+                continue
+            if result.get("status") == "ok":
+                answered.add(result["id"])
+    return answered
+
+
+class BatchRunner:
+    """
+    Answers a batch of questions with one profile and bounded concurrency.
+
+    `concurrency` workers pull the next question from a shared iterator, so at
+    most that many questions are in flight and the clients, LLM cache and
+    indexes loaded by the first question are reused by the rest. Each result is
+    written (and flushed) with its latency and the token usage recorded while it
+    ran; `stats` sums them over the batch.
+    """
+
+    def __init__(self, profile: str, concurrency: int = BATCH_CONCURRENCY):
+        if profile not in ASK:
+            raise ValueError(f"Unknown profile {profile}, expected one of {PROFILES}")
+        self.profile = profile
+        self.concurrency = concurrency
+        self.latencies = []
+        self.stats = {
+            "answered": 0,
+            "failed": 0,
+            "skipped": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    async def _ask(self, item: dict) -> dict:
+        start = time.perf_counter()
+        with usage_scope() as usage, trace_profile(self.profile):
+            with span(f"{self.profile}.question", id=item["id"]):
+                try:
+                    result = await ASK[self.profile](item["question"])
+                    # The parts return their errors as "Error: ..." answers
+                    failed = str(result.get("answer", "")).startswith("Error")
+                    status, error = ("error", result["answer"]) if failed else ("ok", None)
+                except Exception as e:
+                    result, status, error = {}, "error", f"Error: {str(e)}"
+        seconds = time.perf_counter() - start
+        usage = result.pop("agent_usage", usage)
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "profile": self.profile,
+            "status": status,
+            **({"error": error} if error else result),
+            "latency_ms": round(seconds * 1000, 1),
+            # LightRAG calls the LLM from its own worker tasks, not attributable
+            "usage": None if self.profile == "graphrag" else usage,
+        }
+
+    async def _worker(self, items, output):
+        for item in items:
+            record = await self._ask(item)
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+            self.stats["answered" if record["status"] == "ok" else "failed"] += 1
+            self.latencies.append(record["latency_ms"])
+            if record["usage"]:
+                self.stats["prompt_tokens"] += record["usage"]["prompt_tokens"]
+                self.stats["completion_tokens"] += record["usage"]["completion_tokens"]
+            print(f"[{record['status']}] {record['id']} in {record['latency_ms']:.0f}ms")
+
+    async def arun(self, input_path: str, output_path: str) -> dict:
+        answered = load_answered(output_path)
+        pending = []
+        for item in load_questions(input_path):
+            if item["id"] in answered:
+                self.stats["skipped"] += 1
+            else:
+                pending.append(item)
+
+        start = time.perf_counter()
+        items = iter(pending)
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "a", encoding="utf-8") as output:
+            try:
+                await asyncio.gather(
+                    *(self._worker(items, output) for _ in range(self.concurrency))
+                )
+            finally:
+                if self.profile == "graphrag":
+                    from src.Part3_GraphRAG.graphrag_chat import stop_graphrag
+
+                    await stop_graphrag()
+        self.stats["seconds"] = time.perf_counter() - start
+        return self.stats
+
+    def run(self, input_path: str, output_path: str) -> dict:
+        return asyncio.run(self.arun(input_path, output_path))
+
+    def report(self) -> str:
+        done = self.stats["answered"] + self.stats["failed"]
+        seconds = self.stats.get("seconds") or 0.0
+        return (
+            f"{self.stats['answered']} answered, {self.stats['failed']} failed, "
+            f"{self.stats['skipped']} skipped (already answered); "
+            f"{done / seconds if seconds else 0.0:.2f} questions/s, "
+            f"p50 {percentile(self.latencies, 0.5):.0f}ms, "
+            f"p95 {percentile(self.latencies, 0.95):.0f}ms, "
+            f"{self.stats['prompt_tokens']} prompt + "
+            f"{self.stats['completion_tokens']} completion tokens"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of questions with one of the assistants"
+    )
+    parser.add_argument("input", help='JSONL file, one {"id": ..., "question": ...} per line')
+    parser.add_argument("--profile", choices=PROFILES, required=True)
+    parser.add_argument("--output", help="results JSONL, appended to and resumed from")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    output_path = args.output or input_path.with_name(
+        f"{input_path.stem}.{args.profile}.results.jsonl"
+    )
+
+    runner = BatchRunner(args.profile, concurrency=args.concurrency)
+    runner.run(str(input_path), str(output_path))
+    print(f"📊 Batch: {runner.report()}")
+    if tracer.enabled:
+        print(f"📊 Stages:\n{tracer.report()}")
+    print(f"💾 Results: {output_path}")
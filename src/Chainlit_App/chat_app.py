@@ -1,19 +1,101 @@
+import os
+import time
+import asyncio
+import logging
+import importlib
 import chainlit as cl
-
-from src.Part1_Simple_LLM.simple_llm_chat import run_chat as simple_llm_chat
-from src.Part2_RAG.rag_chat import run_chat as rag_chat
-from src.Part3_GraphRAG.graphrag_chat import run_chat as graph_rag_chat
-from src.Part4_Text2SQL.text_to_sql_chat import (
-    write_sql_query,
-    run_sql_query,
-    write_answer,
-    write_plotly_figure,
-)
-from src.Part5_Agent.frc_agent import run_frc_agent
+from src.Common.tracing import tracer, span, trace_profile, TRACING_PROMETHEUS_PORT
 
 # Instrument the OpenAI client
 cl.instrument_openai()
 
+logger = logging.getLogger(__name__)
+
+# Part behind each chat profile. The parts are imported on first use, so the app
+# starts without loading llama_index, lancedb, lightrag, pandas, plotly or agents
+PART_MODULES = {
+    "Simple LLM Chat": "src.Part1_Simple_LLM.simple_llm_chat",
+    "RAG": "src.Part2_RAG.rag_chat",
+    "GraphRAG": "src.Part3_GraphRAG.graphrag_chat",
+    "Text-to-SQL": "src.Part4_Text2SQL.text_to_sql_chat",
+    "FRC Agent": "src.Part5_Agent.frc_agent",
+}
+
+# Comma-separated profiles to load in the background at startup, e.g. "GraphRAG,RAG"
+CHAT_PRELOAD_PROFILES = [
+    name.strip()
+    for name in os.getenv("CHAT_PRELOAD_PROFILES", "").split(",")
+    if name.strip() in PART_MODULES
+]
+
+# Short profile names used to label the tracing spans
+TRACE_PROFILES = {
+    "Simple LLM Chat": "simple",
+    "RAG": "rag",
+    "GraphRAG": "graphrag",
+    "Text-to-SQL": "text2sql",
+    "FRC Agent": "frc",
+}
+
+# Loaded parts and the seconds their import took, by chat profile
+_parts = {}
+import_seconds = {}
+# Background loads, referenced so they are not garbage collected
+_background_tasks = set()
+
+
+async def load_part(chat_profile: str):
+    # Import the part of a chat profile once, off the event loop; concurrent first
+    # questions wait on the same module import
+    part = _parts.get(chat_profile)
+    if part is not None:
+        return part
+    start = time.perf_counter()
+    with span(f"{TRACE_PROFILES[chat_profile]}.import"):
+        part = await asyncio.to_thread(importlib.import_module, PART_MODULES[chat_profile])
+    if chat_profile not in _parts:
+        import_seconds[chat_profile] = time.perf_counter() - start
+        logger.info(f"Loaded the {chat_profile} part in {import_seconds[chat_profile]:.2f}s")
+    _parts[chat_profile] = part
+    return part
+
+
+async def preload_part(chat_profile: str):
+    try:
+        part = await load_part(chat_profile)
+        if chat_profile == "GraphRAG":
+            # Load the GraphRAG storages once for the lifetime of the app
+            await part.start_graphrag()
+        elif chat_profile == "Text-to-SQL":
+            # Start the chart workers, each imports plotly once
+            await asyncio.to_thread(part.figure_sandbox.start)
+    except Exception as e:
+        logger.warning(f"Could not preload the {chat_profile} part: {e}")
+
+
+def preload_in_background(chat_profile: str):
+    task = asyncio.create_task(preload_part(chat_profile))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@cl.on_app_startup
+async def on_app_startup():
+    # The app is ready right away, preloaded parts finish in the background
+    for chat_profile in CHAT_PRELOAD_PROFILES:
+        preload_in_background(chat_profile)
+    if tracer.enabled and TRACING_PROMETHEUS_PORT:
+        tracer.serve_prometheus(TRACING_PROMETHEUS_PORT)
+
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    # Only a loaded GraphRAG part can have open storages
+    if "GraphRAG" in _parts:
+        await _parts["GraphRAG"].stop_graphrag()
+    if "Text-to-SQL" in _parts:
+        _parts["Text-to-SQL"].figure_sandbox.shutdown()
+
 
 @cl.set_chat_profiles
 async def chat_profile():
@@ -44,63 +126,92 @@ async def chat_profile():
 @cl.on_chat_start
 async def on_chat_start():
     chat_profile = cl.user_session.get("chat_profile")
+    # Start loading the part while the user types the first question
+    if chat_profile in PART_MODULES and chat_profile not in _parts:
+        preload_in_background(chat_profile)
     await cl.Message(
         content=f"starting chat using the {chat_profile} chat profile",
     ).send()
 
 
+async def stream_message(tokens) -> cl.Message:
+    # Pass the tokens through to the UI as soon as they arrive
+    msg = cl.Message(content="")
+    async for token in tokens:
+        await msg.stream_token(token)
+    await msg.send()
+    return msg
+
+
 @cl.step(type="Simple LLM Chat")
 async def run_simple_llm_chat(question: str) -> str:
-    final_answer = simple_llm_chat(question)
-    await cl.Message(content=final_answer).send()
+    part = await load_part("Simple LLM Chat")
+    await stream_message(part.astream_chat(question))
 
 
 @cl.step(type="RAG Chat")
 async def run_rag_chat(question: str) -> str:
-    final_answer = rag_chat(question)
-    await cl.Message(content=final_answer).send()
+    part = await load_part("RAG")
+    await stream_message(part.astream_chat(question))
 
 
 @cl.step(type="GraphRAG Chat")
 async def run_graphrag_chat(question: str) -> str:
-    final_answer = graph_rag_chat(question)
-    await cl.Message(content=final_answer).send()
+    part = await load_part("GraphRAG")
+    await stream_message(part.astream_chat(question))
 
 
 @cl.step(type="Text-to-SQL Chat")
 async def run_text_to_sql_chat(question: str) -> str:
+    part = await load_part("Text-to-SQL")
 
     # Show SQL query in collapsed section
     async with cl.Step(name="Generating SQL Query") as step:
-        # write SQL query
-        sql_query_result = write_sql_query(question)
-
-        step.output = sql_query_result.model_dump_json(indent=2)
-        step.language = "json"
+        # write and run SQL query, rejected queries are regenerated by the model
+        sql_query_result, query_results = await part.awrite_and_run_sql_query(question)
+
+        if isinstance(sql_query_result, str):
+            step.output = sql_query_result
+        else:
+            step.output = sql_query_result.model_dump_json(indent=2)
+            step.language = "json"
         step.update()
 
-    # Show SQL query in collapsed section
+    # Show SQL query results in collapsed section
     async with cl.Step(name="Running SQL Query") as step:
-        # run SQL query
-        query_results = run_sql_query(sql_query_result.sql_query)
-
-        step.output = query_results.to_string()
+        if isinstance(query_results, str):
+            step.output = query_results
+        else:
+            step.output = part.results_context(query_results)
         step.update()
 
-    # Generate final answer
-    final_answer = write_answer(question, query_results.to_string())
-    fig = write_plotly_figure(question, query_results.to_string())
-    if fig:
-        elements = [cl.Plotly(name="chart", figure=fig, display="inline")]
-    else:
-        elements = []
-    await cl.Message(content=final_answer, elements=elements).send()
+    if isinstance(query_results, str):
+        await cl.Message(content=query_results).send()
+        return
+
+    # Generate final answer and chart concurrently, the answer is streamed right
+    # away and the chart is attached to it once its code has been generated and run
+    context = part.results_context(query_results)
+    msg, fig = None, None
+    async for name, result in part.fan_out(
+        {
+            "answer": stream_message(part.astream_answer(question, context)),
+            "figure": part.awrite_plotly_figure(question, context, query_results),
+        }
+    ):
+        if name == "answer":
+            msg = result
+        else:
+            fig = part.figure_from_json(result)
+        if msg and fig:
+            msg.elements = [cl.Plotly(name="chart", figure=fig, display="inline")]
+            await msg.update()
 
 
 @cl.step(type="run_frc_agent")
 async def run_frc_agent_chat(question: str) -> str:
-    result = await run_frc_agent(question)
-    await cl.Message(content=result.final_output).send()
+    part = await load_part("FRC Agent")
+    await stream_message(part.astream_frc_agent(question))
 
 
 @cl.on_message  # this function will be called every time a user inputs a message in the UI
@@ -117,7 +228,13 @@ async def main(message: cl.Message):
     """
 
     chat_profile = cl.user_session.get("chat_profile")
+    profile = TRACE_PROFILES.get(chat_profile, chat_profile)
+
+    with trace_profile(profile), span(f"{profile}.question"):
+        await answer_message(chat_profile, message)
+
 
+async def answer_message(chat_profile: str, message: cl.Message):
     if chat_profile == "Simple LLM Chat":
         await run_simple_llm_chat(message.content)
     elif chat_profile == "RAG":
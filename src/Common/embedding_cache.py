@@ -0,0 +1,271 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+import numpy as np
+from src.Common.tracing import annotate
+
+source_dir = Path(__file__).resolve().parent.parent.parent
+EMBEDDING_CACHE_DIR = os.path.join(source_dir, "data/embedding_cache")
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000))
+EMBEDDING_CACHE_DIM = 1536
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace differences (e.g. re-split chunks) should not cost a new embedding
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache shared by indexing and querying, also across
+    processes (e.g. the app and an indexing run on the same directory).
+
+    Vectors live in a memory-mapped float32 array (`vectors.f32`, one row per
+    slot) and a SQLite index (`index.db`) maps sha256(model, normalized text) to
+    the slot and its last access time. Slots are handed out inside a SQLite write
+    transaction, so processes never share a slot, and `checks.u64` keeps a
+    checksum of the key next to each row; a read whose checksum does not match
+    (a slot reused by another process meanwhile) counts as a miss. The array
+    grows on demand up to `max_entries` rows; after that the least recently used
+    slots are reused. `stats` counts hits and misses and estimates the embedding
+    latency the hits saved, from the average latency per text of the misses.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = EMBEDDING_CACHE_DIR,
+        dim: int = EMBEDDING_CACHE_DIM,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        enabled: bool = EMBEDDING_CACHE_ENABLED,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.vectors_path = self.cache_dir / "vectors.f32"
+        self.checks_path = self.cache_dir / "checks.u64"
+        self.index_path = self.cache_dir / "index.db"
+        self.dim = dim
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "embedded_texts": 0,
+            "embedding_seconds": 0.0,
+        }
+        self._lock = threading.Lock()
+        self._conn = None
+        self._vectors = None
+        self._checks = None
+        # Access times of hits, written with the next insert instead of per read
+        self._touched = {}
+
+    @staticmethod
+    def _key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _check(key: str) -> int:
+        # 0 marks a slot that is being written
+        return int(key[:16], 16) or 1
+
+    def _load(self):
+        if self._conn is not None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode, write transactions are opened explicitly in set_many
+        conn = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        if row is None or row[0] != self.dim:
+            # A different dimension invalidates every slot
+            conn.execute("DELETE FROM entries")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (self.dim,))
+        # A smaller max_entries drops the slots past the end
+        conn.execute("DELETE FROM entries WHERE slot >= ?", (self.max_entries,))
+        conn.execute("COMMIT")
+        self._conn = conn
+        self._open_vectors(max(self._next_slot(), 1024))
+
+    def _next_slot(self) -> int:
+        row = self._conn.execute("SELECT MAX(slot) FROM entries").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _open_vectors(self, rows: int):
+        rows = min(rows, self.max_entries)
+        # Grow the files first, memmap maps the existing bytes and keeps them;
+        # another process may already have grown them further
+        for path, width in ((self.vectors_path, self.dim * 4), (self.checks_path, 8)):
+            with open(path, "ab") as file:
+                if file.tell() < rows * width:
+                    file.truncate(rows * width)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._checks.flush()
+        self._vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim)
+        )
+        self._checks = np.memmap(self.checks_path, dtype=np.uint64, mode="r+", shape=(rows,))
+
+    def _ensure_rows(self, slot: int):
+        if slot >= self._vectors.shape[0]:
+            self._open_vectors(max(slot + 1, self._vectors.shape[0] * 2))
+
+    def _free_slot(self) -> int:
+        # Called inside the write transaction, so the index is current
+        slot = self._next_slot()
+        if slot < self.max_entries:
+            return slot
+        # Full, reuse the least recently used slot
+        key, slot = self._conn.execute(
+            "SELECT key, slot FROM entries ORDER BY last_access LIMIT 1"
+        ).fetchone()
+        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.stats["evictions"] += 1
+        return slot
+
+    def _read(self, key: str, slot: int):
+        self._ensure_rows(slot)
+        check = self._check(key)
+        # The checksum is read before and after the vector, a writer clears it
+        # while it replaces the row
+        if self._checks[slot] != check:
+            return None
+        vector = np.array(self._vectors[slot])
+        if self._checks[slot] != check:
+            return None
+        return vector
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def saved_seconds(self) -> float:
+        if not self.stats["embedded_texts"]:
+            return 0.0
+        per_text = self.stats["embedding_seconds"] / self.stats["embedded_texts"]
+        return self.stats["hits"] * per_text
+
+    def get_many(self, model: str, texts: list) -> dict:
+        # Returns {text: vector} for the cached texts
+        if not self.enabled:
+            return {}
+        found = {}
+        now = time.time()
+        with self._lock:
+            self._load()
+            keys = {text: self._key(model, text) for text in texts}
+            placeholders = ",".join("?" * len(keys))
+            slots = dict(
+                self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({placeholders})",
+                    list(set(keys.values())),
+                ).fetchall()
+            )
+            for text, key in keys.items():
+                vector = self._read(key, slots[key]) if key in slots else None
+                if vector is None:
+                    self.stats["misses"] += 1
+                    continue
+                self.stats["hits"] += 1
+                self._touched[key] = now
+                found[text] = vector
+        return found
+
+    def set_many(self, model: str, texts: list, vectors, seconds: float = 0.0):
+        self.stats["embedded_texts"] += len(texts)
+        self.stats["embedding_seconds"] += seconds
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._load()
+            conn = self._conn
+            # The write lock of the index serializes slot allocation across
+            # processes; the index is read inside it, never from a stale copy
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(at, key) for key, at in self._touched.items()],
+                )
+                self._touched = {}
+                for text, vector in zip(texts, vectors):
+                    vector = np.asarray(vector, dtype=np.float32)
+                    if vector.shape != (self.dim,):
+                        continue
+                    key = self._key(model, text)
+                    row = conn.execute(
+                        "SELECT slot FROM entries WHERE key = ?", (key,)
+                    ).fetchone()
+                    slot = row[0] if row else self._free_slot()
+                    self._ensure_rows(slot)
+                    self._checks[slot] = 0
+                    self._vectors[slot] = vector
+                    self._checks[slot] = self._check(key)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, slot, now)
+                    )
+                self._vectors.flush()
+                self._checks.flush()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def aget_many(self, model: str, texts: list) -> dict:
+        # The index and the memmap are blocking, keep them off the event loop
+        if not self.enabled:
+            return {}
+        return await asyncio.to_thread(self.get_many, model, texts)
+
+    async def aset_many(self, model: str, texts: list, vectors, seconds: float = 0.0):
+        await asyncio.to_thread(self.set_many, model, texts, vectors, seconds)
+
+    def wrap(self, embed_func, model: str):
+        # Async embedding function (texts -> np.ndarray) that only sends the
+        # uncached texts to `embed_func`, e.g. LightRAG's openai_embed
+        async def cached_embed(texts: list, **kwargs) -> np.ndarray:
+            found = await self.aget_many(model, texts)
+            pending = list(dict.fromkeys(t for t in texts if t not in found))
+            if pending:
+                start = time.perf_counter()
+                vectors = await embed_func(pending, **kwargs)
+                await self.aset_many(model, pending, vectors, time.perf_counter() - start)
+                found.update(zip(pending, np.asarray(vectors, dtype=np.float32)))
+            else:
+                annotate(cache_hit=True)
+            return np.array([found[t] for t in texts], dtype=np.float32)
+
+        return cached_embed
+
+    def report(self) -> str:
+        return (
+            f"{self.stats['hits']} hits, {self.stats['misses']} misses "
+            f"(hit rate {self.hit_rate():.0%}), ~{self.saved_seconds():.2f}s of "
+            f"embedding latency saved, {self.stats['evictions']} evictions"
+        )
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,264 @@
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+import numpy as np
+from openai import RateLimitError, APIConnectionError, InternalServerError
+from src.Common.llm_clients import async_client
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+# Inputs per embeddings request and requests in flight, tuned for GitHub Models
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", 60))
+
+# Checkpoint record: sha256 of the model and text, the dimension (uint32), then
+# the float32 vector
+CHECKPOINT_KEY_BYTES = 32
+CHECKPOINT_HEADER_BYTES = CHECKPOINT_KEY_BYTES + 4
+
+
+class TokenBucket:
+    """
+    Paces requests to `rate` per minute with bursts of up to `capacity`.
+
+    The rate is adaptive: `slow_down` halves it after a rate limit response and
+    `speed_up` recovers it a little after every successful request, up to the
+    configured rate.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: int = None):
+        self.max_rate = rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.min_rate = self.max_rate / 16
+        self.capacity = capacity or max(1, int(rate_per_minute / 10))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def slow_down(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate * 1.05)
+
+
+class EmbeddingPipeline:
+    """
+    Embeds many texts with batched, concurrent and rate-limit aware requests.
+
+    Texts are deduplicated and split into batches of `batch_size`, at most
+    `max_concurrency` requests are in flight and all of them are paced by a shared
+    token bucket. Rate limit (429) responses are retried with exponential backoff,
+    honouring `Retry-After`, and slow the bucket down; connection errors and 5xx
+    responses are retried with the same backoff. Finished batches are appended
+    to the binary `checkpoint_path`, so a crashed run resumes without paying for
+    the embeddings it already got; only the offsets of the checkpoint records
+    are kept in memory and the vectors are read back when asked for. The
+    pipeline holds the vectors of one `aembed` call until it returns them, the
+    caller decides how many texts that is. With an `EmbeddingCache`, texts
+    embedded by an earlier run (or by a query) are not sent again.
+    """
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        requests_per_minute: float = EMBEDDING_REQUESTS_PER_MINUTE,
+        checkpoint_path=None,
+        max_retries: int = 8,
+        client=async_client,
+        cache=None,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.cache = cache
+        self.max_retries = max_retries
+        # Retries are handled here, with backoff shared by all batches
+        self.client = client.with_options(max_retries=0)
+        self.stats = {
+            "texts": 0,
+            "from_checkpoint": 0,
+            "from_cache": 0,
+            "requests": 0,
+            "rate_limited": 0,
+            "retried": 0,
+            "seconds": 0.0,
+        }
+        # Checkpoint offset and dimension by key
+        self._checkpoint = self._load_checkpoint()
+        self._checkpoint_lock = threading.Lock()
+        self._loop = None
+        self._bucket = None
+        self._semaphore = None
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\n{text}".encode("utf-8")).hexdigest()
+
+    def _load_checkpoint(self) -> dict:
+        index = {}
+        if not self.checkpoint_path or not self.checkpoint_path.exists():
+            return index
+        size = self.checkpoint_path.stat().st_size
+        with open(self.checkpoint_path, "r+b") as file:
+            offset = 0
+            while offset + CHECKPOINT_HEADER_BYTES <= size:
+                header = file.read(CHECKPOINT_HEADER_BYTES)
+                dim = int.from_bytes(header[CHECKPOINT_KEY_BYTES:], "little")
+                end = offset + CHECKPOINT_HEADER_BYTES + dim * 4
+                if end > size:
+                    # A crash may leave the last record half written
+                    break
+                index[header[:CHECKPOINT_KEY_BYTES].hex()] = (
+                    offset + CHECKPOINT_HEADER_BYTES,
+                    dim,
+                )
+                file.seek(end)
+                offset = end
+            # Drop a half written last record, new records are appended after it
+            file.truncate(offset)
+        return index
+
+    def _read_checkpoint(self, keys: list) -> dict:
+        vectors = {}
+        with open(self.checkpoint_path, "rb") as file:
+            for key in keys:
+                offset, dim = self._checkpoint[key]
+                file.seek(offset)
+                vectors[key] = np.frombuffer(file.read(dim * 4), dtype=np.float32)
+        return vectors
+
+    def _save_checkpoint(self, keys: list, embeddings: list):
+        if not self.checkpoint_path:
+            return
+        records, index = [], {}
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, "ab") as file:
+                offset = file.tell()
+                for key, embedding in zip(keys, embeddings):
+                    vector = np.asarray(embedding, dtype="<f4")
+                    records.append(bytes.fromhex(key))
+                    records.append(len(vector).to_bytes(4, "little"))
+                    records.append(vector.tobytes())
+                    index[key] = (offset + CHECKPOINT_HEADER_BYTES, len(vector))
+                    offset += CHECKPOINT_HEADER_BYTES + vector.nbytes
+                file.write(b"".join(records))
+            self._checkpoint.update(index)
+
+    def clear_checkpoint(self):
+        # Call once the embeddings have been stored for good
+        if self.checkpoint_path and self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
+        self._checkpoint = {}
+
+    async def _embed_batch(self, batch: list) -> dict:
+        keys = [self._key(text) for text in batch]
+        backoff = 1.0
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self._bucket.acquire()
+                try:
+                    self.stats["requests"] += 1
+                    request_start = time.perf_counter()
+                    response = await self.client.embeddings.create(
+                        model=self.model, input=batch
+                    )
+                except RateLimitError as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self.stats["rate_limited"] += 1
+                    self._bucket.slow_down()
+                    retry_after = e.response.headers.get("retry-after")
+                    delay = float(retry_after) if retry_after else backoff
+                    backoff = min(backoff * 2, 60.0)
+                    reason = "rate limited"
+                except (APIConnectionError, InternalServerError) as e:
+                    # Transient, one failed batch must not abort the whole run
+                    if attempt == self.max_retries:
+                        raise
+                    self.stats["retried"] += 1
+                    delay = backoff
+                    backoff = min(backoff * 2, 60.0)
+                    reason = f"failed ({type(e).__name__})"
+                else:
+                    self._bucket.speed_up()
+                    embeddings = [item.embedding for item in response.data]
+                    await asyncio.to_thread(self._save_checkpoint, keys, embeddings)
+                    if self.cache:
+                        await self.cache.aset_many(
+                            self.model,
+                            batch,
+                            embeddings,
+                            time.perf_counter() - request_start,
+                        )
+                    return dict(zip(batch, embeddings))
+            # Sleep outside the semaphore so other batches can use the slot
+            logger.warning(f"Embeddings {reason}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay + random.uniform(0, delay / 4))
+
+    async def aembed(self, texts: list) -> np.ndarray:
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Created per event loop, asyncio primitives cannot be shared between loops
+            self._loop = loop
+            self._bucket = TokenBucket(self.requests_per_minute)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        unique = list(dict.fromkeys(texts))
+        keys = {text: self._key(text) for text in unique}
+        # Vectors of this call only, by text
+        vectors = {}
+        checkpointed = [t for t in unique if keys[t] in self._checkpoint]
+        if checkpointed:
+            stored = await asyncio.to_thread(
+                self._read_checkpoint, [keys[t] for t in checkpointed]
+            )
+            vectors.update((t, stored[keys[t]]) for t in checkpointed)
+        rest = [t for t in unique if t not in vectors]
+        cached = await self.cache.aget_many(self.model, rest) if self.cache and rest else {}
+        vectors.update(cached)
+        pending = [t for t in rest if t not in cached]
+        self.stats["texts"] += len(texts)
+        self.stats["from_cache"] += len(cached)
+        self.stats["from_checkpoint"] += len(checkpointed)
+
+        batches = [
+            pending[i : i + self.batch_size]
+            for i in range(0, len(pending), self.batch_size)
+        ]
+        for embedded in await asyncio.gather(*(self._embed_batch(batch) for batch in batches)):
+            vectors.update(embedded)
+
+        self.stats["seconds"] += time.perf_counter() - start
+        return np.array([vectors[t] for t in texts], dtype=np.float32)
+
+    def embed(self, texts: list) -> np.ndarray:
+        return asyncio.run(self.aembed(texts))
@@ -0,0 +1,381 @@
+import os
+import time
+import asyncio
+import json
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+import numpy as np
+from src.Common.llm_clients import (
+    client,
+    async_client,
+    astream_completion,
+    record_usage,
+)
+from src.Common.tracing import annotate
+from src.Common.question_literals import same_literals
+
+source_dir = Path(__file__).resolve().parent.parent.parent
+CACHE_DB_PATH = os.path.join(source_dir, "data/llm_cache.db")
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_SEMANTIC = os.getenv("LLM_CACHE_SEMANTIC", "false").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 24 * 60 * 60))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2000))
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+class LLMCache:
+    """
+    Response cache in front of the chat completion calls, stored on local SQLite.
+
+    Entries are keyed on (model, system prompt, user prompt). A lookup first tries
+    the exact hash of the key; when `semantic` is on, it falls back to the most
+    similar cached question with the same model and system prompt, if that
+    similarity is above `similarity_threshold` and both questions mention the same
+    numbers, names and negations ("team 5715" and "team 254" do not share answers).
+    The question embeddings of a scope are loaded once into an in-memory matrix
+    that `set` keeps up to date. Entries expire after `ttl_seconds` and the least
+    recently used ones are evicted once there are more than `max_entries`. The
+    async variants run the SQLite work in a worker thread.
+    """
+
+    def __init__(
+        self,
+        db_path: str = CACHE_DB_PATH,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        semantic: bool = LLM_CACHE_SEMANTIC,
+        similarity_threshold: float = 0.95,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self.enabled = enabled
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._conn = None
+        # Semantic lookup index by scope: keys, questions, created_at and the
+        # matrix of question embeddings, loaded on the first lookup of the scope
+        self._scopes = {}
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    embedding BLOB,
+                    question TEXT,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(llm_cache)")}
+            if "question" not in columns:
+                # Caches from before the literal check, their entries only hit exactly
+                self._conn.execute("ALTER TABLE llm_cache ADD COLUMN question TEXT")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_scope ON llm_cache (scope)"
+            )
+        return self._conn
+
+    @staticmethod
+    def _hash(*parts: str) -> str:
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def hit_rate(self) -> float:
+        hits = self.stats["hits"] + self.stats["semantic_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _lookup_exact(self, key: str, now: float):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key)
+                )
+                conn.commit()
+        return row[0] if row else None
+
+    def _scope_index(self, conn, scope: str) -> dict:
+        if scope not in self._scopes:
+            rows = conn.execute(
+                """
+                SELECT key, question, created_at, embedding FROM llm_cache
+                WHERE scope = ? AND embedding IS NOT NULL AND question IS NOT NULL
+                """,
+                (scope,),
+            ).fetchall()
+            self._scopes[scope] = {
+                "keys": [row[0] for row in rows],
+                "questions": [row[1] for row in rows],
+                "created_at": np.array([row[2] for row in rows], dtype=np.float64),
+                "matrix": np.vstack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+                if rows
+                else None,
+            }
+        return self._scopes[scope]
+
+    def _index_forget(self, keys: set):
+        for index in self._scopes.values():
+            keep = [i for i, key in enumerate(index["keys"]) if key not in keys]
+            if len(keep) == len(index["keys"]):
+                continue
+            index["keys"] = [index["keys"][i] for i in keep]
+            index["questions"] = [index["questions"][i] for i in keep]
+            index["created_at"] = index["created_at"][keep]
+            index["matrix"] = index["matrix"][keep] if keep else None
+
+    def _index_add(self, scope, key, question, embedding, now):
+        # Scopes that were not looked up yet are read from SQLite when they are
+        if scope not in self._scopes or embedding is None or question is None:
+            return
+        self._index_forget({key})
+        index = self._scopes[scope]
+        vector = embedding.astype(np.float32)[None, :]
+        index["keys"].append(key)
+        index["questions"].append(question)
+        index["created_at"] = np.append(index["created_at"], now)
+        index["matrix"] = (
+            vector if index["matrix"] is None else np.vstack([index["matrix"], vector])
+        )
+
+    def _lookup_similar(self, scope: str, question: str, embedding: np.ndarray, now: float):
+        with self._lock:
+            conn = self._connection()
+            index = self._scope_index(conn, scope)
+            if index["matrix"] is None:
+                return None
+
+            similarities = index["matrix"] @ embedding
+            similarities[index["created_at"] <= now - self.ttl_seconds] = -1.0
+            # The most similar question that asks about the same values
+            for best in np.argsort(-similarities):
+                if similarities[best] < self.similarity_threshold:
+                    return None
+                if not same_literals(question, index["questions"][best]):
+                    continue
+                key = index["keys"][best]
+                row = conn.execute(
+                    "SELECT response FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    # Evicted by another process
+                    continue
+                conn.execute(
+                    "UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key)
+                )
+                conn.commit()
+                return row[0]
+        return None
+
+    def _store(self, key, scope, response, embedding, question, now):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache
+                    (key, scope, response, embedding, question, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    scope,
+                    response,
+                    embedding.tobytes() if embedding is not None else None,
+                    question,
+                    now,
+                    now,
+                ),
+            )
+            # Drop expired entries, then the least recently used ones over the bound
+            expired = {
+                row[0]
+                for row in conn.execute(
+                    "SELECT key FROM llm_cache WHERE created_at <= ?",
+                    (now - self.ttl_seconds,),
+                )
+            }
+            evicted = {
+                row[0]
+                for row in conn.execute(
+                    """
+                    SELECT key FROM llm_cache WHERE created_at > ?
+                    ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    """,
+                    (now - self.ttl_seconds, self.max_entries),
+                )
+            }
+            conn.executemany(
+                "DELETE FROM llm_cache WHERE key = ?", [(k,) for k in expired | evicted]
+            )
+            conn.commit()
+            self._index_forget(expired | evicted)
+            self._index_add(scope, key, question, embedding, now)
+        self.stats["evictions"] += len(evicted)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _embed(self, text: str) -> np.ndarray:
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+        return self._normalize(response.data[0].embedding)
+
+    async def _aembed(self, text: str) -> np.ndarray:
+        response = await async_client.embeddings.create(
+            model=EMBEDDING_MODEL, input=text
+        )
+        return self._normalize(response.data[0].embedding)
+
+    def _record(self, response, semantic_hit=False):
+        if response is None:
+            self.stats["misses"] += 1
+            return response
+        if semantic_hit:
+            self.stats["semantic_hits"] += 1
+        else:
+            self.stats["hits"] += 1
+        annotate(cache_hit="semantic" if semantic_hit else "exact")
+        return response
+
+    def get(self, model, system_prompt, user_prompt, question=None):
+        # Returns the cached response and the question embedding to pass to `set`
+        if not self.enabled:
+            return None, None
+        now = time.time()
+        response = self._lookup_exact(
+            self._hash(model, system_prompt, user_prompt), now
+        )
+        if response is not None or not self.semantic:
+            return self._record(response), None
+
+        question = question or user_prompt
+        embedding = self._embed(question)
+        response = self._lookup_similar(
+            self._hash(model, system_prompt), question, embedding, now
+        )
+        return self._record(response, semantic_hit=True), embedding
+
+    async def aget(self, model, system_prompt, user_prompt, question=None):
+        if not self.enabled:
+            return None, None
+        now = time.time()
+        response = await asyncio.to_thread(
+            self._lookup_exact, self._hash(model, system_prompt, user_prompt), now
+        )
+        if response is not None or not self.semantic:
+            return self._record(response), None
+
+        question = question or user_prompt
+        embedding = await self._aembed(question)
+        response = await asyncio.to_thread(
+            self._lookup_similar, self._hash(model, system_prompt), question, embedding, now
+        )
+        return self._record(response, semantic_hit=True), embedding
+
+    def set(self, model, system_prompt, user_prompt, response, embedding=None, question=None):
+        if not self.enabled or response is None:
+            return
+        self._store(
+            self._hash(model, system_prompt, user_prompt),
+            self._hash(model, system_prompt),
+            response,
+            embedding,
+            question or user_prompt,
+            time.time(),
+        )
+
+    async def aset(self, model, system_prompt, user_prompt, response, embedding=None, question=None):
+        if not self.enabled or response is None:
+            return
+        await asyncio.to_thread(
+            self.set, model, system_prompt, user_prompt, response, embedding, question
+        )
+
+    def discard(self, model, system_prompt, user_prompt):
+        # Forget a cached response that turned out to be unusable
+        if not self.enabled:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key = ?",
+                (self._hash(model, system_prompt, user_prompt),),
+            )
+            conn.commit()
+
+
+llm_cache = LLMCache()
+
+
+def split_messages(messages: list):
+    # The cache key uses the system prompt and the user prompt of a single turn
+    system_prompt = "".join(m["content"] for m in messages if m["role"] == "system")
+    user_prompt = "".join(m["content"] for m in messages if m["role"] == "user")
+    return system_prompt, user_prompt
+
+
+def cached_completion(model: str, messages: list, question: str = None) -> str:
+    system_prompt, user_prompt = split_messages(messages)
+    cached, embedding = llm_cache.get(model, system_prompt, user_prompt, question)
+    if cached is not None:
+        return cached
+
+    response = client.chat.completions.create(model=model, messages=messages)
+    record_usage(model, response.usage)
+    content = response.choices[0].message.content
+    llm_cache.set(model, system_prompt, user_prompt, content, embedding, question)
+    return content
+
+
+async def acached_completion(model: str, messages: list, question: str = None) -> str:
+    system_prompt, user_prompt = split_messages(messages)
+    cached, embedding = await llm_cache.aget(
+        model, system_prompt, user_prompt, question
+    )
+    if cached is not None:
+        return cached
+
+    response = await async_client.chat.completions.create(
+        model=model, messages=messages
+    )
+    record_usage(model, response.usage)
+    content = response.choices[0].message.content
+    await llm_cache.aset(model, system_prompt, user_prompt, content, embedding, question)
+    return content
+
+
+async def astream_cached_completion(model: str, messages: list, question: str = None):
+    # Cached answers are yielded in one piece, fresh ones are streamed and stored
+    system_prompt, user_prompt = split_messages(messages)
+    cached, embedding = await llm_cache.aget(
+        model, system_prompt, user_prompt, question
+    )
+    if cached is not None:
+        yield cached
+        return
+
+    tokens = []
+    async for token in astream_completion(model=model, messages=messages):
+        tokens.append(token)
+        yield token
+    await llm_cache.aset(
+        model, system_prompt, user_prompt, "".join(tokens), embedding, question
+    )
@@ -0,0 +1,114 @@
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+from dotenv import load_dotenv
+from src.Common.tracing import record_tokens
+
+# Load environment variables from .env file
+load_dotenv()
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+
+class LazyClient:
+    """
+    Stand-in for an OpenAI client that builds it on first use.
+
+    Attribute access (`client.chat`, `client.embeddings`, `with_options`, ...) is
+    forwarded to the client, which `factory` creates once, so importing a module
+    that holds a `LazyClient` neither imports `openai` nor opens a connection
+    pool. `get()` returns the client itself, for libraries that need the real type.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def _build_client():
+    from openai import OpenAI
+
+    return OpenAI(base_url=OPENAI_API_BASE, api_key=OPENAI_API_KEY)
+
+
+def _build_async_client():
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(base_url=OPENAI_API_BASE, api_key=OPENAI_API_KEY)
+
+
+# Shared OpenAI clients with GitHub Models, reused by all parts so every
+# request goes through the same connection pool; created on the first request
+client = LazyClient(_build_client)
+async_client = LazyClient(_build_async_client)
+
+# Token usage per model as reported by the provider, including the prompt tokens
+# that were served from its prefix cache
+usage_stats = defaultdict(
+    lambda: {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+)
+
+
+# Usage of the current unit of work (e.g. one batch item), see usage_scope
+_scope_usage = contextvars.ContextVar("scope_usage", default=None)
+
+
+@contextmanager
+def usage_scope():
+    # Collects the usage recorded inside the block; asyncio tasks and to_thread
+    # calls copy the context, so concurrent scopes do not mix
+    usage = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    token = _scope_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _scope_usage.reset(token)
+
+
+def record_usage(model: str, usage):
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    for stats in (usage_stats[model], _scope_usage.get()):
+        if stats is None:
+            continue
+        stats["requests"] += 1
+        stats["prompt_tokens"] += usage.prompt_tokens or 0
+        stats["cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
+        stats["completion_tokens"] += usage.completion_tokens or 0
+    record_tokens(usage.prompt_tokens, usage.completion_tokens)
+
+
+def format_usage(model: str) -> str:
+    stats = usage_stats[model]
+    share = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0
+    return (
+        f"{model}: {stats['cached_tokens']} of {stats['prompt_tokens']} prompt tokens "
+        f"served from the provider cache ({share:.0%}) over {stats['requests']} requests"
+    )
+
+
+async def astream_completion(model: str, **kwargs):
+    # Yield the completion tokens as they arrive instead of the finished text; the
+    # usage comes in a last chunk without choices when it is asked for
+    stream = await async_client.chat.completions.create(
+        model=model, stream=True, stream_options={"include_usage": True}, **kwargs
+    )
+    async for chunk in stream:
+        if chunk.usage:
+            record_usage(model, chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
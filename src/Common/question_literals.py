@@ -0,0 +1,36 @@
+import re
+
+# Questions that embed close together can still ask for different things: "top 5"
+# vs "top 10", "team 5715" vs "team 254", "at Google" vs "at Microsoft", or the
+# negated question. Reusing an earlier answer or query by similarity is only safe
+# when both questions mention the same values and negations.
+
+NEGATIONS = {"not", "no", "without", "never", "except", "excluding", "non", "nobody", "none"}
+
+
+def numbers_in(text: str) -> set:
+    return set(re.findall(r"\d+(?:\.\d+)?", text))
+
+
+def literals_in(text: str) -> set:
+    # Values a question filters on: numbers, quoted strings and capitalized
+    # names after the first word ("at Google" vs "at Microsoft")
+    quoted = re.findall(r"[\"']([^\"']+)[\"']", text)
+    words = re.findall(r"[A-Za-z][\w&.-]*", text)
+    names = [word for word in words[1:] if word[0].isupper()]
+    return numbers_in(text) | {value.lower() for value in quoted + names}
+
+
+def words_in(text: str) -> list:
+    text = text.lower().replace("n't", " not")
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def negations_in(text: str) -> set:
+    return NEGATIONS & set(words_in(text))
+
+
+def same_literals(question: str, other: str) -> bool:
+    return literals_in(question) == literals_in(other) and negations_in(
+        question
+    ) == negations_in(other)
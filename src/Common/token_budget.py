@@ -0,0 +1,110 @@
+import os
+import logging
+from functools import lru_cache
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Token budget for the context part of a prompt, per model. Prompt size drives
+# time-to-first-token, so these are well below the models' context windows.
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-4o-mini": int(os.getenv("CONTEXT_TOKEN_BUDGET_GPT_4O_MINI", 4000)),
+    "gpt-4.1": int(os.getenv("CONTEXT_TOKEN_BUDGET_GPT_4_1", 8000)),
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 4000
+# Characters per token used when the tokenizer cannot be loaded
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    # tiktoken downloads the BPE file on first use; when that fails (offline, no
+    # cache) token counts fall back to an estimate instead of breaking the answer
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(
+            f"Could not load the {model} tokenizer, estimating tokens from characters: {e}"
+        )
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN
+    return len(encoding.encode(text))
+
+
+def context_budget(model: str) -> int:
+    return CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+
+def trim_to_budget(text: str, budget: int, model: str = "gpt-4o-mini") -> str:
+    # Cut the text at a token boundary so it fits in the budget
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[: budget * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text)
+    if len(tokens) <= budget:
+        return text
+    return encoding.decode(tokens[:budget])
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = text.lower().split()
+    return {" ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def dedupe_chunks(chunks: list, overlap_threshold: float = 0.8) -> list:
+    """
+    Drop chunks that repeat an earlier chunk.
+
+    A chunk is dropped when most of its word 5-grams (at least `overlap_threshold`)
+    already appear in one kept chunk, which catches exact duplicates as well as
+    the overlapping windows produced by the sentence splitter. The order of the
+    remaining chunks is kept.
+    """
+    kept, kept_shingles = [], []
+    for chunk in chunks:
+        if not chunk.strip():
+            continue
+        shingles = _shingles(chunk)
+        if any(
+            len(shingles & other) / len(shingles) >= overlap_threshold
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def fit_chunks(chunks: list, budget: int, model: str = "gpt-4o-mini") -> list:
+    # Keep whole chunks in rank order while they fit, trim the first one that
+    # does not and drop the rest
+    fitted, used = [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk, model)
+        if used + tokens <= budget:
+            fitted.append(chunk)
+            used += tokens
+            continue
+        if budget - used > 0:
+            fitted.append(trim_to_budget(chunk, budget - used, model))
+        break
+    return fitted
+
+
+def build_context(chunks: list, model: str, budget: int = None) -> str:
+    budget = budget or context_budget(model)
+    return "\n".join(fit_chunks(dedupe_chunks(chunks), budget, model))
+
+
+def log_prompt_size(label: str, model: str, messages: list) -> int:
+    tokens = sum(count_tokens(message["content"], model) for message in messages)
+    logger.info(f"{label} prompt for {model}: {tokens} tokens")
+    return tokens
@@ -0,0 +1,339 @@
+import os
+import sys
+import atexit
+import json
+import time
+import inspect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+source_dir = Path(__file__).resolve().parent.parent.parent
+
+# Off by default, a disabled span is one attribute check
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+# Finished spans are appended here, empty to keep them in memory only
+TRACING_EXPORT_PATH = os.getenv(
+    "TRACING_EXPORT_PATH", os.path.join(source_dir, "data/traces.jsonl")
+)
+# Serves /metrics in the Prometheus text format when set
+TRACING_PROMETHEUS_PORT = int(os.getenv("TRACING_PROMETHEUS_PORT", 0))
+# Latencies kept per (profile, stage) for the percentiles
+MAX_SAMPLES = 1000
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+def percentile(values, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+class NoopSpan:
+    # Returned by every span while tracing is off
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Span:
+    """
+    One timed stage of a request, e.g. the retrieval or the SQL execution.
+
+    Spans nest through a context variable, so the tokens recorded inside a span
+    are also added to the spans around it. `profile` is the one set with
+    `trace_profile` (the chat profile or batch profile), or the first part of
+    the stage name.
+    """
+
+    __slots__ = ("tracer", "name", "profile", "parent", "attributes", "start", "seconds", "_token")
+
+    def __init__(self, tracer, name: str, profile: str = None, detached: bool = False, **attributes):
+        self.tracer = tracer
+        self.name = name
+        self.profile = profile or _current_profile.get() or name.split(".")[0]
+        # Detached spans run in tasks that outlive the request that created them
+        self.parent = None if detached else _current_span.get()
+        self.attributes = {"prompt_tokens": 0, "completion_tokens": 0, **attributes}
+        self.seconds = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.seconds = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Async generators may be closed from another context
+            pass
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer.finish(self)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
+        span = self
+        while span is not None and span.seconds is None:
+            span.attributes["prompt_tokens"] += prompt_tokens
+            span.attributes["completion_tokens"] += completion_tokens
+            span = span.parent
+
+
+class Tracer:
+    """
+    Collects spans: wall time, prompt and completion tokens and cache hits per
+    stage.
+
+    Finished spans are appended to `export_path` as JSONL and aggregated per
+    (profile, stage) for `summary` (p50/p95) and `render_prometheus`. When
+    `enabled` is False, `span` returns a shared no-op span and `traced`
+    functions are called directly.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TRACING_ENABLED,
+        export_path: str = TRACING_EXPORT_PATH,
+        max_samples: int = MAX_SAMPLES,
+    ):
+        self.enabled = enabled
+        self.export_path = export_path
+        self._lock = threading.Lock()
+        self._file = None
+        self._flushed_at = 0.0
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._totals = defaultdict(
+            lambda: {
+                "count": 0,
+                "seconds": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cache_hits": 0,
+                "errors": 0,
+            }
+        )
+
+    def span(self, name: str, profile: str = None, detached: bool = False, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, profile, detached, **attributes)
+
+    def _aggregate(self, profile: str, stage: str, seconds: float, attributes: dict):
+        self._samples[(profile, stage)].append(seconds)
+        totals = self._totals[(profile, stage)]
+        totals["count"] += 1
+        totals["seconds"] += seconds
+        totals["prompt_tokens"] += attributes.get("prompt_tokens", 0)
+        totals["completion_tokens"] += attributes.get("completion_tokens", 0)
+        totals["cache_hits"] += bool(attributes.get("cache_hit"))
+        totals["errors"] += "error" in attributes
+
+    def finish(self, span: Span):
+        with self._lock:
+            self._aggregate(span.profile, span.name, span.seconds, span.attributes)
+            if self.export_path:
+                self._export(span)
+
+    def _export(self, span: Span):
+        if self._file is None:
+            Path(self.export_path).parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.export_path, "a", encoding="utf-8")
+            atexit.register(self._file.close)
+        record = {
+            "time": time.time(),
+            "profile": span.profile,
+            "stage": span.name,
+            "parent": span.parent.name if span.parent else None,
+            "ms": round(span.seconds * 1000, 2),
+            **span.attributes,
+        }
+        self._file.write(json.dumps(record, default=str) + "\n")
+        # Flushed about once a second instead of a write call per span
+        if record["time"] - self._flushed_at > 1.0:
+            self._file.flush()
+            self._flushed_at = record["time"]
+
+    def annotate(self, **attributes):
+        # Sets attributes (e.g. cache_hit=True) on the innermost open span
+        if self.enabled:
+            span = _current_span.get()
+            if span is not None:
+                span.set(**attributes)
+
+    def record_tokens(self, prompt_tokens: int, completion_tokens: int):
+        if self.enabled:
+            span = _current_span.get()
+            if span is not None:
+                span.add_tokens(prompt_tokens or 0, completion_tokens or 0)
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = {key: list(values) for key, values in self._samples.items()}
+            totals = {key: dict(values) for key, values in self._totals.items()}
+        result = defaultdict(dict)
+        for (profile, stage), values in sorted(samples.items()):
+            result[profile][stage] = {
+                **totals[(profile, stage)],
+                "p50_ms": round(percentile(values, 0.5) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            }
+        return dict(result)
+
+    def report(self) -> str:
+        return format_summary(self.summary())
+
+    def render_prometheus(self) -> str:
+        # Samples of one metric family have to be contiguous, after its TYPE line
+        families = {
+            "dabtech_stage_seconds summary": [],
+            "dabtech_stage_tokens_total counter": [],
+            "dabtech_stage_cache_hits_total counter": [],
+            "dabtech_stage_errors_total counter": [],
+        }
+        seconds, tokens, cache_hits, errors = families.values()
+        for profile, stages in self.summary().items():
+            for stage, stats in stages.items():
+                labels = f'profile="{profile}",stage="{stage}"'
+                for quantile, key in (("0.5", "p50_ms"), ("0.95", "p95_ms")):
+                    seconds.append(
+                        f'dabtech_stage_seconds{{{labels},quantile="{quantile}"}} '
+                        f"{stats[key] / 1000}"
+                    )
+                seconds.append(f"dabtech_stage_seconds_sum{{{labels}}} {stats['seconds']}")
+                seconds.append(f"dabtech_stage_seconds_count{{{labels}}} {stats['count']}")
+                for kind in ("prompt", "completion"):
+                    tokens.append(
+                        f'dabtech_stage_tokens_total{{{labels},kind="{kind}"}} '
+                        f"{stats[f'{kind}_tokens']}"
+                    )
+                cache_hits.append(f"dabtech_stage_cache_hits_total{{{labels}}} {stats['cache_hits']}")
+                errors.append(f"dabtech_stage_errors_total{{{labels}}} {stats['errors']}")
+        lines = []
+        for family, samples in families.items():
+            lines.append(f"# TYPE {family}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int = TRACING_PROMETHEUS_PORT):
+        # GET /metrics on a daemon thread, for a local Prometheus to scrape
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def format_summary(summary: dict) -> str:
+    lines = []
+    for profile, stages in summary.items():
+        lines.append(f"{profile}:")
+        for stage, stats in stages.items():
+            lines.append(
+                f"  {stage}: {stats['count']} spans, p50 {stats['p50_ms']:.1f}ms, "
+                f"p95 {stats['p95_ms']:.1f}ms, {stats['prompt_tokens']} prompt + "
+                f"{stats['completion_tokens']} completion tokens, "
+                f"{stats['cache_hits']} cache hits, {stats['errors']} errors"
+            )
+    return "\n".join(lines)
+
+
+tracer = Tracer()
+span = tracer.span
+annotate = tracer.annotate
+record_tokens = tracer.record_tokens
+
+
+@contextmanager
+def trace_profile(profile: str):
+    # Labels the spans of the block with a profile, e.g. the chat profile
+    token = _current_profile.set(profile)
+    try:
+        yield
+    finally:
+        _current_profile.reset(token)
+
+
+def traced(name: str, **attributes):
+    # Decorator form of `span` for sync and async functions
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.span(name, **attributes):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name, **attributes):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def summarize_file(export_path: str) -> dict:
+    # Rebuilds the per profile summary from an exported JSONL file
+    offline = Tracer(enabled=True, export_path="", max_samples=sys.maxsize)
+    with open(export_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            offline._aggregate(
+                record["profile"], record["stage"], record["ms"] / 1000, record
+            )
+    return offline.summary()
+
+
+if __name__ == "__main__":
+    export_path = sys.argv[1] if len(sys.argv) > 1 else TRACING_EXPORT_PATH
+    print(f"📊 Stages of {export_path} (p50/p95 per profile):")
+    print(format_summary(summarize_file(export_path)))
@@ -1,17 +1,12 @@
-import os
 from pathlib import Path
-from openai import OpenAI
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Initialize OpenAI client with GitHub Models
-client = OpenAI(
-    base_url=OPENAI_API_BASE,
-    api_key=OPENAI_API_KEY,
+from src.Common.llm_clients import format_usage
+from src.Common.tracing import span
+from src.Common.token_budget import trim_to_budget, context_budget, log_prompt_size
+from src.Common.llm_cache import (
+    llm_cache,
+    cached_completion,
+    acached_completion,
+    astream_cached_completion,
 )
 
 
@@ -22,10 +17,14 @@ file_path = (
     / "community_generic_info.txt"
 )
 with open(file_path, "r", encoding="utf-8") as file:
-    context_text = file.read()
-
-# Developer prompt defining the assistant's role and behavior
-DEVELOPER_PROMPT = """
+    # Keep the fixed context within the model's prompt budget
+    context_text = trim_to_budget(
+        file.read(), context_budget("gpt-4o-mini"), "gpt-4o-mini"
+    )
+
+# Developer prompt defining the assistant's role and behavior, followed by the
+# static CONTEXT so the whole system message is a stable, cacheable prompt prefix
+DEVELOPER_PROMPT_TEMPLATE = """
 # Identity
 You are a helpful assistant that provides information only about the Dabburiya Tech community based on the provided context.
 
@@ -35,47 +34,87 @@ If the question is related to the chat purpose but the answer is not found in th
 The assistant never invents facts not present in the CONTEXT.
 
 # Examples
+
+# CONTEXT
+{context}
 """
+DEVELOPER_PROMPT = DEVELOPER_PROMPT_TEMPLATE.format(context=context_text)
 
-# User prompt template for dynamic question insertion
+# User prompt template for dynamic question insertion, kept after the static prefix
 USER_PROMPT_TEMPLATE = """
 You are being asked a question about the Dabburiya Tech community.
 
 QUESTION:
 {question}
 
-CONTEXT:
-{context}
-
 INSTRUCTIONS:
 Answer the QUESTION using only the CONTEXT.
 If the answer is not found in the CONTEXT, reply: "Not in provided context".
 """
 
 
-# Function to run chat completion
-def run_chat(question: str) -> str:
+def build_messages(question: str) -> list:
+    USER_PROMPT = USER_PROMPT_TEMPLATE.format(question=question)
+    messages = [
+        {"role": "system", "content": DEVELOPER_PROMPT},
+        {"role": "user", "content": USER_PROMPT},
+    ]
+    log_prompt_size("Simple LLM", "gpt-4o-mini", messages)
+    return messages
+
 
-    USER_PROMPT = USER_PROMPT_TEMPLATE.format(question=question, context=context_text)
+# Function to run chat completion
+def run_chat(question: str, report_usage: bool = False) -> str:
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": DEVELOPER_PROMPT},
-                {"role": "user", "content": USER_PROMPT},
-            ],
-        )
+        with span("simple.llm"):
+            answer = cached_completion(
+                model="gpt-4o-mini",
+                messages=build_messages(question),
+                question=question,
+            )
+        if report_usage:
+            # Cached tokens as reported in response.usage.prompt_tokens_details
+            print(f"📊 Prompt cache usage: {format_usage('gpt-4o-mini')}")
+        return answer
+
+    except Exception as e:
+        return f"Error: {str(e)}"
 
-        return response.choices[0].message.content
+
+# Async variant of run_chat that does not block the event loop
+async def arun_chat(question: str) -> str:
+    try:
+        with span("simple.llm"):
+            return await acached_completion(
+                model="gpt-4o-mini",
+                messages=build_messages(question),
+                question=question,
+            )
 
     except Exception as e:
         return f"Error: {str(e)}"
 
 
+# Streaming variant of run_chat that yields the answer tokens as they arrive
+async def astream_chat(question: str):
+    try:
+        with span("simple.llm"):
+            async for token in astream_cached_completion(
+                model="gpt-4o-mini",
+                messages=build_messages(question),
+                question=question,
+            ):
+                yield token
+
+    except Exception as e:
+        yield f"Error: {str(e)}"
+
+
 if __name__ == "__main__":
     question = "what the community trying to empower?"
     print(f"\n🔍 User question: {question}")
 
     # Get community advice
-    response = run_chat(question)
+    response = run_chat(question, report_usage=True)
     print(f"💡 Chat Response:\n{response}")
+    print(f"📊 LLM cache stats: {llm_cache.stats}")
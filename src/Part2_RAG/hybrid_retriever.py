@@ -0,0 +1,167 @@
+import os
+import re
+import math
+from collections import Counter
+from llama_index.core.schema import (
+    NodeWithScore,
+    TextNode,
+    NodeRelationship,
+    RelatedNodeInfo,
+)
+
+# vector: embeddings only, bm25: full-text only, hybrid: both fused with RRF,
+# auto: full-text only for keyword lookups (e.g. a person's name), hybrid otherwise
+RETRIEVAL_MODES = ["vector", "bm25", "hybrid", "auto"]
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+
+# Usual constant of reciprocal rank fusion, damps the weight of the top ranks
+RRF_K = 60
+
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "did", "do", "does", "for", "from",
+    "has", "have", "he", "her", "his", "how", "i", "in", "is", "it", "of", "on",
+    "or", "she", "the", "their", "they", "to", "was", "what", "when", "where",
+    "which", "who", "whom", "with",
+}
+
+
+def tokenize(text: str) -> list:
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over the chunks stored in the LanceDB table.
+
+    It is built from the same rows as the vector retriever, so both return the
+    same node ids and their rankings can be fused. Scoring is local and needs no
+    embedding call.
+    """
+
+    def __init__(self, nodes: list, k1: float = 1.5, b: float = 0.75):
+        self.nodes = nodes
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(node.get_content())) for node in nodes]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if nodes else 0.0
+        self.doc_freqs = Counter(term for tf in self.term_freqs for term in tf)
+
+    @classmethod
+    def from_table(cls, table, **kwargs):
+        # Columns written by LanceDBVectorStore: id, doc_id, vector, text, metadata
+        rows = table.to_arrow().select(["id", "doc_id", "text"]).to_pylist()
+        nodes = []
+        for row in rows:
+            node = TextNode(id_=row["id"], text=row["text"] or "")
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
+                node_id=row["doc_id"]
+            )
+            nodes.append(node)
+        return cls(nodes, **kwargs)
+
+    def idf(self, term: str) -> float:
+        n, df = len(self.nodes), self.doc_freqs.get(term, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, terms: list) -> list:
+        scores = [0.0] * len(self.nodes)
+        for term in set(terms):
+            if term not in self.doc_freqs:
+                continue
+            idf = self.idf(term)
+            for i, tf in enumerate(self.term_freqs):
+                freq = tf.get(term)
+                if not freq:
+                    continue
+                norm = 1 - self.b + self.b * self.lengths[i] / self.avg_length
+                scores[i] += idf * freq * (self.k1 + 1) / (freq + self.k1 * norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 3) -> list:
+        scores = self.scores(tokenize(query))
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return [
+            NodeWithScore(node=self.nodes[i], score=scores[i])
+            for i in ranked[:top_k]
+            if scores[i] > 0
+        ]
+
+    def is_keyword_lookup(
+        self, query: str, max_keyword_df: int = 3, margin: float = 1.5
+    ) -> bool:
+        # A query with a distinctive term (found in only a few chunks, like a
+        # name) whose top BM25 hit clearly beats the runner-up is answered
+        # without the embedding call
+        terms = tokenize(query)
+        if not any(0 < self.doc_freqs.get(t, 0) <= max_keyword_df for t in terms):
+            return False
+        top = sorted(self.scores(terms), reverse=True)[:2] + [0.0]
+        return top[0] > 0 and top[0] >= margin * top[1]
+
+
+def reciprocal_rank_fusion(rankings: list, top_k: int, k: int = RRF_K) -> list:
+    fused, nodes = {}, {}
+    for ranking in rankings:
+        for rank, node_with_score in enumerate(ranking):
+            node_id = node_with_score.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank + 1)
+            nodes.setdefault(node_id, node_with_score.node)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [NodeWithScore(node=nodes[node_id], score=fused[node_id]) for node_id in ranked]
+
+
+class HybridRetriever:
+    """
+    Combines the vector retriever with a local BM25 index.
+
+    In `hybrid` mode each retriever fetches `candidate_k` nodes and the two
+    rankings are fused with reciprocal rank fusion into the top `similarity_top_k`.
+    In `auto` mode keyword lookups are answered from BM25 alone, which skips the
+    network embedding call. `stats` counts the queries per retrieval path.
+    """
+
+    def __init__(
+        self,
+        vector_retriever,
+        bm25_index: BM25Index,
+        mode: str = RAG_RETRIEVAL_MODE,
+        similarity_top_k: int = 3,
+        candidate_k: int = 10,
+    ):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode}, expected one of {RETRIEVAL_MODES}")
+        self.vector_retriever = vector_retriever
+        self.bm25_index = bm25_index
+        self.mode = mode
+        self.similarity_top_k = similarity_top_k
+        self.candidate_k = candidate_k
+        self.stats = {"vector": 0, "bm25": 0, "hybrid": 0}
+
+    def _route(self, query: str, mode: str = None) -> str:
+        mode = mode or self.mode
+        if mode == "auto":
+            return "bm25" if self.bm25_index.is_keyword_lookup(query) else "hybrid"
+        return mode
+
+    def _fuse(self, query: str, vector_nodes: list) -> list:
+        bm25_nodes = self.bm25_index.search(query, self.candidate_k)
+        return reciprocal_rank_fusion([vector_nodes, bm25_nodes], self.similarity_top_k)
+
+    def retrieve(self, query: str, mode: str = None) -> list:
+        route = self._route(query, mode)
+        self.stats[route] += 1
+        if route == "bm25":
+            return self.bm25_index.search(query, self.similarity_top_k)
+        if route == "vector":
+            return self.vector_retriever.retrieve(query)[: self.similarity_top_k]
+        return self._fuse(query, self.vector_retriever.retrieve(query))
+
+    async def aretrieve(self, query: str, mode: str = None) -> list:
+        route = self._route(query, mode)
+        self.stats[route] += 1
+        if route == "bm25":
+            return self.bm25_index.search(query, self.similarity_top_k)
+        if route == "vector":
+            return (await self.vector_retriever.aretrieve(query))[: self.similarity_top_k]
+        return self._fuse(query, await self.vector_retriever.aretrieve(query))
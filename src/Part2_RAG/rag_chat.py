@@ -1,36 +1,76 @@
-import os
+import time
+import asyncio
+import logging
+import threading
 from pathlib import Path
-from dotenv import load_dotenv
-from openai import OpenAI
+import lancedb
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.vector_stores.lancedb import LanceDBVectorStore
 from llama_index.core import VectorStoreIndex
 from llama_index.core.retrievers import VectorIndexRetriever
+from src.Common.llm_clients import OPENAI_API_BASE, OPENAI_API_KEY
+from src.Common.embedding_cache import embedding_cache
+from src.Common.tracing import span
+from src.Part2_RAG.hybrid_retriever import BM25Index, HybridRetriever, RAG_RETRIEVAL_MODE
+from src.Common.token_budget import build_context as build_budgeted_context
+from src.Common.token_budget import log_prompt_size
+from src.Common.llm_cache import (
+    llm_cache,
+    cached_completion,
+    acached_completion,
+    astream_cached_completion,
+)
 
-# Load environment variables from .env file
-load_dotenv()
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Initialize OpenAI client with GitHub Models
-client = OpenAI(
-    base_url=OPENAI_API_BASE,
-    api_key=OPENAI_API_KEY,
-)
+class CachedOpenAIEmbedding(OpenAIEmbedding):
+    """
+    `OpenAIEmbedding` that looks up the shared local embedding cache first, so a
+    repeated question is embedded without a network call.
+    """
+
+    def _get_query_embedding(self, query: str) -> list:
+        found = embedding_cache.get_many(self.model_name, [query])
+        if query in found:
+            return found[query].tolist()
+        start = time.perf_counter()
+        embedding = super()._get_query_embedding(query)
+        embedding_cache.set_many(
+            self.model_name, [query], [embedding], time.perf_counter() - start
+        )
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> list:
+        found = await embedding_cache.aget_many(self.model_name, [query])
+        if query in found:
+            return found[query].tolist()
+        start = time.perf_counter()
+        embedding = await super()._aget_query_embedding(query)
+        await embedding_cache.aset_many(
+            self.model_name, [query], [embedding], time.perf_counter() - start
+        )
+        return embedding
+
 
 # Initialize Azure OpenAI Embedding model
-embedding_client = OpenAIEmbedding(
+embedding_client = CachedOpenAIEmbedding(
     api_base=OPENAI_API_BASE, api_key=OPENAI_API_KEY, model="text-embedding-3-small"
 )
 
 
-def load_index():
-    source_dir = Path(__file__).resolve().parent.parent.parent
+source_dir = Path(__file__).resolve().parent.parent.parent
+VECTOR_DIRECTORY_PATH = source_dir / "data" / "lancedb"
+VECTOR_TABLE_NAME = "vectors"
+HYBRID_CANDIDATE_K = 10
 
+logger = logging.getLogger(__name__)
+
+
+def load_index(mode: str = RAG_RETRIEVAL_MODE):
     # Load vectors from existing LanceDB vector store
-    vector_directory_path = source_dir / "data" / "lancedb"
     vector_store = LanceDBVectorStore(
-        uri=f"{vector_directory_path}", query_type="vector"
+        uri=f"{VECTOR_DIRECTORY_PATH}",
+        table_name=VECTOR_TABLE_NAME,
+        query_type="vector",
     )
 
     # Create storage context with the vector store
@@ -38,13 +78,111 @@ def load_index():
         vector_store, embed_model=embedding_client
     )
 
-    # Create vector retriever from the vector index
-    vector_retriever = VectorIndexRetriever(index=vector_index, similarity_top_k=3)
-    return vector_retriever
+    # Create vector retriever from the vector index, it fetches extra candidates
+    # for the fusion with the full-text results
+    vector_retriever = VectorIndexRetriever(
+        index=vector_index, similarity_top_k=HYBRID_CANDIDATE_K
+    )
+
+    # Full-text index over the same rows, built locally from the LanceDB table
+    table = lancedb.connect(f"{VECTOR_DIRECTORY_PATH}").open_table(VECTOR_TABLE_NAME)
+    bm25_index = BM25Index.from_table(table)
 
+    return HybridRetriever(
+        vector_retriever,
+        bm25_index,
+        mode=mode,
+        similarity_top_k=3,
+        candidate_k=HYBRID_CANDIDATE_K,
+    )
 
-def run_llm_response(question: str, retrieved_context: str) -> str:
-    DEVELOPER_PROMPT = """
+
+class RetrieverRegistry:
+    """
+    Process-lifetime cache of the LanceDB hybrid (vector + BM25) retriever.
+
+    The store is opened once and shared by every caller (e.g. concurrent Chainlit
+    sessions). The LanceDB table version is checked at most every
+    `check_interval` seconds; when `rag_indexing.index_documents` has written a new
+    version, the retriever and its BM25 index are rebuilt and swapped in without
+    blocking readers of the previous one.
+    """
+
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._retriever = None
+        self._version = None
+        self._last_check = 0.0
+        self._db = None
+        self.stats = {
+            "opens": 0,
+            "reloads": 0,
+            "hits": 0,
+            "last_open_seconds": None,
+            "last_reload_seconds": None,
+        }
+
+    def _table_version(self):
+        if self._db is None:
+            self._db = lancedb.connect(f"{VECTOR_DIRECTORY_PATH}")
+        return self._db.open_table(VECTOR_TABLE_NAME).version
+
+    def _is_stale(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        try:
+            return self._table_version() != self._version
+        except Exception as e:
+            logger.warning(f"Could not read LanceDB table version: {e}")
+            return False
+
+    def get(self):
+        retriever = self._retriever
+        if retriever is not None and not self._is_stale():
+            self.stats["hits"] += 1
+            return retriever
+
+        with self._lock:
+            # Another session may have (re)loaded the retriever while we waited
+            if self._retriever is not None and self._retriever is not retriever:
+                self.stats["hits"] += 1
+                return self._retriever
+
+            is_reload = self._retriever is not None
+            start = time.perf_counter()
+            version = self._table_version()
+            new_retriever = load_index()
+            elapsed = time.perf_counter() - start
+
+            self._retriever, self._version = new_retriever, version
+            self._last_check = time.monotonic()
+            if is_reload:
+                self.stats["reloads"] += 1
+                self.stats["last_reload_seconds"] = elapsed
+                logger.info(
+                    f"Reloaded RAG retriever (table version {version}) in {elapsed:.3f}s"
+                )
+            else:
+                self.stats["opens"] += 1
+                self.stats["last_open_seconds"] = elapsed
+                logger.info(
+                    f"Opened RAG retriever (table version {version}) in {elapsed:.3f}s"
+                )
+            return new_retriever
+
+    def invalidate(self):
+        with self._lock:
+            self._retriever = None
+            self._version = None
+
+
+retriever_registry = RetrieverRegistry()
+
+
+DEVELOPER_PROMPT = """
     # Identity
     You are a helpful assistant that provides information only about the Dabburiya Tech community members based on the provided context.
 
@@ -56,7 +194,7 @@ def run_llm_response(question: str, retrieved_context: str) -> str:
     # Examples
     """
 
-    USER_PROMPT_TEMPLATE = """
+USER_PROMPT_TEMPLATE = """
     You are being asked a question about the Dabburiya Tech community members.
 
     QUESTION:
@@ -70,35 +208,96 @@ def run_llm_response(question: str, retrieved_context: str) -> str:
     If the answer is not found in the CONTEXT, reply: "Not in provided context".
     """
 
+
+def build_messages(question: str, retrieved_context: str) -> list:
     USER_PROMPT = USER_PROMPT_TEMPLATE.format(
         retrieved_context=retrieved_context, question=question
     )
+    messages = [
+        {"role": "system", "content": DEVELOPER_PROMPT},
+        {"role": "user", "content": USER_PROMPT},
+    ]
+    log_prompt_size("RAG", "gpt-4.1", messages)
+    return messages
+
+
+def build_context(retrieved_nodes) -> str:
+    # Nodes come in rank order; drop overlapping ones and fit the rest in the budget
+    return build_budgeted_context(
+        [node.get_content() for node in retrieved_nodes], "gpt-4.1"
+    )
+
+
+def run_llm_response(question: str, retrieved_context: str) -> str:
+    return cached_completion(
+        model="gpt-4.1",
+        messages=build_messages(question, retrieved_context),
+        question=question,
+    )
+
 
-    response = client.chat.completions.create(
+async def arun_llm_response(question: str, retrieved_context: str) -> str:
+    return await acached_completion(
         model="gpt-4.1",
-        messages=[
-            {"role": "system", "content": DEVELOPER_PROMPT},
-            {"role": "user", "content": USER_PROMPT},
-        ],
+        messages=build_messages(question, retrieved_context),
+        question=question,
     )
-    return response.choices[0].message.content
+
+
+# Streaming variant of run_llm_response that yields the answer tokens
+async def astream_llm_response(question: str, retrieved_context: str):
+    async for token in astream_cached_completion(
+        model="gpt-4.1",
+        messages=build_messages(question, retrieved_context),
+        question=question,
+    ):
+        yield token
 
 
 def run_chat(question: str) -> str:
 
-    # Load vector retriever
-    vector_retriever = load_index()
+    # Get the shared hybrid retriever (opened once per process)
+    vector_retriever = retriever_registry.get()
+
+    # Retrieve relevant context from the vector store and the full-text index
+    with span("rag.retrieve"):
+        retrieved_context = vector_retriever.retrieve(question)
+        retrieved_context_str = build_context(retrieved_context)
+
+    with span("rag.llm"):
+        response = run_llm_response(question, retrieved_context_str)
+    return response
+
+
+# Async variant of run_chat that does not block the event loop
+async def arun_chat(question: str) -> str:
+
+    # Opening/reloading the store touches the disk, keep it off the event loop
+    vector_retriever = await asyncio.to_thread(retriever_registry.get)
 
     # Retrieve relevant context from the vector store
-    retrieved_context = vector_retriever.retrieve(question)
-    retrieved_context_str = ""
-    for node in retrieved_context:
-        retrieved_context_str += "\n" + node.get_content()
+    with span("rag.retrieve"):
+        retrieved_context = await vector_retriever.aretrieve(question)
+        retrieved_context_str = build_context(retrieved_context)
 
-    response = run_llm_response(question, retrieved_context_str)
+    with span("rag.llm"):
+        response = await arun_llm_response(question, retrieved_context_str)
     return response
 
 
+# Streaming variant of run_chat, retrieval first and then the answer tokens
+async def astream_chat(question: str):
+    vector_retriever = await asyncio.to_thread(retriever_registry.get)
+
+    with span("rag.retrieve"):
+        retrieved_context = await vector_retriever.aretrieve(question)
+        retrieved_context_str = build_context(retrieved_context)
+
+    with span("rag.llm"):
+        async for token in astream_llm_response(question, retrieved_context_str):
+            yield token
+
+
 if __name__ == "__main__":
     question = "where nadeem azaizah currently working?"
     print(f"\n🔍 User question: {question}")
@@ -106,3 +305,7 @@ if __name__ == "__main__":
     # Get response from the LLM based on RAG retrieved context
     response = run_chat(question)
     print(f"💡 Chat Response:\n{response}")
+    print(f"📊 Retriever stats: {retriever_registry.stats}")
+    print(f"📊 Retrieval paths: {retriever_registry.get().stats}")
+    print(f"📊 LLM cache stats: {llm_cache.stats}")
+    print(f"📊 Embedding cache: {embedding_cache.report()}")
@@ -1,14 +1,21 @@
 import os
+import json
+import hashlib
+import argparse
 from pathlib import Path
 from dotenv import load_dotenv
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.vector_stores.lancedb import LanceDBVectorStore
 from llama_index.core import (
+    Settings,
     SimpleDirectoryReader,
     StorageContext,
     VectorStoreIndex,
 )
+from llama_index.core.schema import MetadataMode
 from llama_index.core.retrievers import VectorIndexRetriever
+from src.Common.embedding_pipeline import EmbeddingPipeline
+from src.Common.embedding_cache import embedding_cache
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,30 +28,138 @@ embedding_client = OpenAIEmbedding(
 )
 
 
-def index_documents():
-    source_dir = Path(__file__).resolve().parent.parent.parent
+source_dir = Path(__file__).resolve().parent.parent.parent
+DATA_DIRECTORY_PATH = source_dir / "data" / "profiles_examples"
+VECTOR_DIRECTORY_PATH = source_dir / "data" / "lancedb"
+VECTOR_TABLE_NAME = "vectors"
+# Content hash of every indexed source file, used to re-index only what changed
+MANIFEST_PATH = VECTOR_DIRECTORY_PATH / "index_manifest.json"
+# Embeddings of an interrupted run, so the next run resumes from there
+EMBEDDING_CHECKPOINT_PATH = VECTOR_DIRECTORY_PATH / "embedding_checkpoint.bin"
 
-    # Load documents from the specified directory
-    data_directory_path = source_dir / "data" / "profiles_examples"
-    documents = SimpleDirectoryReader(data_directory_path).load_data()
-    print(len(documents))
 
-    vector_directory_path = source_dir / "data" / "lancedb"
-    vector_store = LanceDBVectorStore(
-        uri=f"{vector_directory_path}", mode="overwrite", query_type="vector"
+def hash_file(file_path: Path) -> str:
+    return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+
+def load_manifest():
+    if not MANIFEST_PATH.exists():
+        return None
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_manifest(file_hashes: dict):
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as file:
+        json.dump(file_hashes, file, indent=2, sort_keys=True)
+
+
+def plan_index_changes(file_hashes: dict, manifest: dict) -> dict:
+    # Compare the current source files against the hashes of the last indexing run
+    return {
+        "added": sorted(name for name in file_hashes if name not in manifest),
+        "changed": sorted(
+            name
+            for name in file_hashes
+            if name in manifest and manifest[name] != file_hashes[name]
+        ),
+        "removed": sorted(name for name in manifest if name not in file_hashes),
+        "unchanged": sorted(
+            name for name in file_hashes if manifest.get(name) == file_hashes[name]
+        ),
+    }
+
+
+def print_index_report(changes: dict):
+    for status in ["added", "changed", "removed"]:
+        for name in changes[status]:
+            print(f"  {status}: {name}")
+    print(
+        f"{len(changes['added'])} added, {len(changes['changed'])} changed, "
+        f"{len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged"
     )
 
-    # Create storage context with the vector store
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
-    # Create vector index from documents
-    vector_index = VectorStoreIndex.from_documents(
-        documents=documents,
-        show_progress=True,
-        storage_context=storage_context,
-        embed_model=embedding_client,
+def load_documents(file_names: list):
+    documents = SimpleDirectoryReader(
+        input_files=[DATA_DIRECTORY_PATH / name for name in file_names]
+    ).load_data()
+    # Use the file name as the document id so its vectors can be deleted later
+    for document in documents:
+        document.id_ = Path(document.metadata["file_path"]).name
+    return documents
+
+
+def embed_documents(documents, embedding_pipeline: EmbeddingPipeline):
+    # Split into nodes and embed them in batches, the index then skips its own
+    # embedding calls for nodes that already have an embedding
+    nodes = Settings.node_parser.get_nodes_from_documents(documents)
+    embeddings = embedding_pipeline.embed(
+        [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    )
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding.tolist()
+    return nodes
+
+
+def index_documents(incremental: bool = True, dry_run: bool = False):
+    file_hashes = {
+        file_path.name: hash_file(file_path)
+        for file_path in sorted(DATA_DIRECTORY_PATH.iterdir())
+        if file_path.is_file()
+    }
+
+    # Without a manifest we cannot tell which vectors belong to which file
+    manifest = load_manifest() if incremental else None
+    full_rebuild = manifest is None
+    changes = plan_index_changes(file_hashes, manifest or {})
+    print_index_report(changes)
+    if dry_run:
+        return None
+
+    embedding_pipeline = EmbeddingPipeline(
+        checkpoint_path=EMBEDDING_CHECKPOINT_PATH, cache=embedding_cache
     )
 
+    vector_store = LanceDBVectorStore(
+        uri=f"{VECTOR_DIRECTORY_PATH}",
+        table_name=VECTOR_TABLE_NAME,
+        mode="overwrite" if full_rebuild else "append",
+        query_type="vector",
+    )
+
+    if full_rebuild:
+        # Create storage context with the vector store
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+
+        # Create vector index from the embedded document nodes
+        vector_index = VectorStoreIndex(
+            nodes=embed_documents(
+                load_documents(list(file_hashes)), embedding_pipeline
+            ),
+            show_progress=True,
+            storage_context=storage_context,
+            embed_model=embedding_client,
+        )
+    else:
+        vector_index = VectorStoreIndex.from_vector_store(
+            vector_store, embed_model=embedding_client
+        )
+
+        # Drop the vectors of removed and changed files, then embed only the new content
+        for name in changes["removed"] + changes["changed"]:
+            vector_store.delete(name)
+        to_embed = changes["added"] + changes["changed"]
+        if to_embed:
+            vector_index.insert_nodes(
+                embed_documents(load_documents(to_embed), embedding_pipeline)
+            )
+
+    save_manifest(file_hashes)
+    embedding_pipeline.clear_checkpoint()
+    print(f"Embedding stats: {embedding_pipeline.stats}")
+    print(f"Embedding cache: {embedding_cache.report()}")
+
     # Create vector retriever from the vector index
     vector_retriever = VectorIndexRetriever(
         index=vector_index,
@@ -54,8 +169,18 @@ def index_documents():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the member profiles")
+    parser.add_argument(
+        "--full", action="store_true", help="re-embed every file from scratch"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only report what would change"
+    )
+    args = parser.parse_args()
 
-    vector_retriever = index_documents()
+    vector_retriever = index_documents(incremental=not args.full, dry_run=args.dry_run)
+    if vector_retriever is None:
+        raise SystemExit(0)
 
     question = "where nadeem azaizah currently working?"
     print(f"\n🔍 User question: {question}")
@@ -5,27 +5,49 @@ from dotenv import load_dotenv
 from lightrag import LightRAG, QueryParam
 from lightrag.llm.openai import openai_complete, openai_embed
 from lightrag.kg.shared_storage import initialize_pipeline_status
-from lightrag.utils import setup_logger
+from lightrag.utils import setup_logger, EmbeddingFunc
+from src.Common.embedding_pipeline import EMBEDDING_MODEL, EMBEDDING_DIM
+from src.Common.embedding_cache import embedding_cache
+from src.Common.tracing import span, traced
+from src.Part3_GraphRAG.memmap_vector_storage import GRAPHRAG_VECTOR_STORAGE
 
 # Load environment variables from .env file
 load_dotenv()
 OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-setup_logger("lightrag", level="INFO")
-
 source_dir = Path(__file__).resolve().parent.parent.parent
 WORKING_DIR = os.path.join(source_dir, "data/lightrag_storage/")
-if not os.path.exists(WORKING_DIR):
-    os.mkdir(WORKING_DIR)
+
+
+async def traced_openai_complete(prompt, system_prompt=None, history_messages=None, **kwargs):
+    # LightRAG calls the LLM from its own worker tasks, so the spans are detached
+    # from the request; keyword extraction is the first LLM call of a query
+    stage = "graphrag.keywords" if kwargs.get("keyword_extraction") else "graphrag.llm"
+    with span(stage, profile="graphrag", detached=True):
+        return await openai_complete(
+            prompt, system_prompt=system_prompt, history_messages=history_messages, **kwargs
+        )
 
 
 async def initialize_rag():
+    # Set up on first use rather than at import, see start_graphrag
+    setup_logger("lightrag", level="INFO")
+    os.makedirs(WORKING_DIR, exist_ok=True)
+
     rag = LightRAG(
         working_dir=WORKING_DIR,
         max_parallel_insert=4,
-        embedding_func=openai_embed,
-        llm_model_func=openai_complete,
+        vector_storage=GRAPHRAG_VECTOR_STORAGE,
+        # Query embeddings go through the shared local cache before openai_embed
+        embedding_func=EmbeddingFunc(
+            embedding_dim=EMBEDDING_DIM,
+            max_token_size=8192,
+            func=traced("graphrag.embed", profile="graphrag", detached=True)(
+                embedding_cache.wrap(openai_embed, EMBEDDING_MODEL)
+            ),
+        ),
+        llm_model_func=traced_openai_complete,
         cosine_threshold=0.5,
         cosine_better_than_threshold=0.5,
         addon_params={
@@ -49,20 +71,77 @@ async def initialize_rag():
     return rag
 
 
-def run_chat(query):
-    graphrag = asyncio.run(initialize_rag())
+# Long-lived LightRAG instance shared by all queries in this process
+_graphrag = None
+_graphrag_lock = asyncio.Lock()
+
+
+async def start_graphrag():
+    # Load the LightRAG storages once; later calls return the same instance
+    global _graphrag
+    if _graphrag is not None:
+        return _graphrag
+    async with _graphrag_lock:
+        if _graphrag is None:
+            _graphrag = await initialize_rag()
+    return _graphrag
+
+
+async def stop_graphrag():
+    # Flush and close the LightRAG storages
+    global _graphrag
+    async with _graphrag_lock:
+        if _graphrag is not None:
+            await _graphrag.finalize_storages()
+            _graphrag = None
+
+
+async def arun_chat(query):
+    graphrag = await start_graphrag()
 
     query_param = QueryParam(mode="hybrid", response_type="Single Paragraph", top_k=3)
 
-    response = asyncio.run(
-        graphrag.aquery(
+    with span("graphrag.query"):
+        response = await graphrag.aquery(
             query=query,
             param=query_param,
         )
-    )
     return response
 
 
+# Streaming variant of arun_chat that yields the answer tokens as they arrive
+async def astream_chat(query):
+    graphrag = await start_graphrag()
+
+    query_param = QueryParam(
+        mode="hybrid", response_type="Single Paragraph", top_k=3, stream=True
+    )
+
+    with span("graphrag.query"):
+        response = await graphrag.aquery(
+            query=query,
+            param=query_param,
+        )
+
+        # LightRAG returns a plain string for cached answers and failures
+        if isinstance(response, str):
+            yield response
+            return
+
+        async for token in response:
+            yield token
+
+
+def run_chat(query):
+    async def _run():
+        try:
+            return await arun_chat(query)
+        finally:
+            await stop_graphrag()
+
+    return asyncio.run(_run())
+
+
 if __name__ == "__main__":
     question = "where nadeem azaizah currently working?"
     print(f"\n🔍 User question: {question}")
@@ -4,9 +4,22 @@ import asyncio
 import json
 from dotenv import load_dotenv
 from lightrag import LightRAG, QueryParam
-from lightrag.llm.openai import openai_complete, openai_embed
 from lightrag.kg.shared_storage import initialize_pipeline_status
-from lightrag.utils import setup_logger
+from lightrag.utils import setup_logger, EmbeddingFunc
+from src.Common.embedding_pipeline import (
+    EmbeddingPipeline,
+    EMBEDDING_DIM,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+)
+from src.Common.embedding_cache import embedding_cache
+from src.Part3_GraphRAG.memmap_vector_storage import GRAPHRAG_VECTOR_STORAGE
+from src.Part3_GraphRAG.graphrag_ingestion import (
+    TrackedLLM,
+    IngestionDriver,
+    iter_profiles,
+    GRAPHRAG_MAX_LLM_CONCURRENCY,
+)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,13 +33,30 @@ WORKING_DIR = os.path.join(source_dir, "data/lightrag_storage/")
 if not os.path.exists(WORKING_DIR):
     os.mkdir(WORKING_DIR)
 
+# Batched, rate-limit aware embeddings that resume from the checkpoint after a crash
+embedding_pipeline = EmbeddingPipeline(
+    checkpoint_path=os.path.join(WORKING_DIR, "embedding_checkpoint.bin"),
+    cache=embedding_cache,
+)
+
+# LLM calls with adaptive concurrency and token usage per document
+tracked_llm = TrackedLLM()
+
 
 async def initialize_rag():
     rag = LightRAG(
         working_dir=WORKING_DIR,
-        max_parallel_insert=4,
-        embedding_func=openai_embed,
-        llm_model_func=openai_complete,
+        vector_storage=GRAPHRAG_VECTOR_STORAGE,
+        embedding_func=EmbeddingFunc(
+            embedding_dim=EMBEDDING_DIM,
+            max_token_size=8192,
+            func=embedding_pipeline.aembed,
+        ),
+        embedding_batch_num=EMBEDDING_BATCH_SIZE,
+        embedding_func_max_async=EMBEDDING_MAX_CONCURRENCY,
+        # Document parallelism is tuned by the ingestion driver
+        llm_model_func=tracked_llm,
+        llm_model_max_async=GRAPHRAG_MAX_LLM_CONCURRENCY,
         cosine_threshold=0.5,
         cosine_better_than_threshold=0.5,
         addon_params={
@@ -50,31 +80,25 @@ async def initialize_rag():
     return rag
 
 
-def load_profiles(profiles_folder):
-    text_inputs = []
-    documents_ids = []
-    profile_files = os.listdir(profiles_folder)
-    for profile_file in profile_files:
-        with open(
-            os.path.join(profiles_folder, profile_file), "r", encoding="utf-8"
-        ) as file:
-            profile_content = file.read()
-        text_inputs.append(str(profile_content))
-        documents_ids.append(profile_file)
-
-    print(f"Total profiles to insert: {len(text_inputs)}")
-    print(f"Total profiles to insert: {len(documents_ids)}")
-    return text_inputs, documents_ids
+async def aindex_graphrag(profiles_folder: str):
+    graphrag = await initialize_rag()
+    driver = IngestionDriver(graphrag, tracked_llm, embedding_pipeline)
+    await driver.run(iter_profiles(profiles_folder))
+    await graphrag.finalize_storages()
+    return graphrag, driver
 
 
 def index_graphrag():
-    graphrag = asyncio.run(initialize_rag())
-
     profiles_folder = os.path.join(source_dir, "data/profiles_examples/")
-    text_inputs, documents_ids = load_profiles(profiles_folder)
-
-    asyncio.run(graphrag.ainsert(input=text_inputs, ids=documents_ids))
-    asyncio.run(graphrag.finalize_storages())
+    graphrag, driver = asyncio.run(aindex_graphrag(profiles_folder))
+
+    embedding_pipeline.clear_checkpoint()
+    for record in driver.report:
+        print(record)
+    print(f"Ingestion stats: {driver.stats}")
+    print(f"LLM stats: {tracked_llm.stats}, shared usage {dict(tracked_llm.usage).get('shared')}")
+    print(f"Embedding stats: {embedding_pipeline.stats}")
+    print(f"Embedding cache: {embedding_cache.report()}")
     return graphrag
 
 
@@ -0,0 +1,301 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import defaultdict
+from openai import RateLimitError
+from src.Common.llm_clients import async_client
+
+logger = logging.getLogger(__name__)
+
+GRAPHRAG_LLM_MODEL = "gpt-4o-mini"
+# Documents processed in parallel, tuned between these bounds while indexing
+GRAPHRAG_MIN_PARALLEL_INSERT = 1
+GRAPHRAG_MAX_PARALLEL_INSERT = int(os.getenv("GRAPHRAG_MAX_PARALLEL_INSERT", 8))
+# LLM requests in flight, tuned between 1 and this bound on rate limits
+GRAPHRAG_MAX_LLM_CONCURRENCY = int(os.getenv("GRAPHRAG_MAX_LLM_CONCURRENCY", 8))
+# Seconds between doc status checks while a document is in the LightRAG pipeline
+GRAPHRAG_STATUS_POLL_SECONDS = 1.0
+# A document still not processed after this long is recorded as failed
+GRAPHRAG_DOCUMENT_TIMEOUT_SECONDS = float(os.getenv("GRAPHRAG_DOCUMENT_TIMEOUT_SECONDS", 1800))
+
+# Completion arguments passed through from LightRAG, the rest are LightRAG internals
+LLM_ARGUMENTS = {"temperature", "top_p", "max_tokens", "response_format"}
+
+
+def iter_profiles(profiles_folder: str):
+    # Read one profile at a time, only when the driver asks for the next one
+    with os.scandir(profiles_folder) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            with open(entry.path, "r", encoding="utf-8") as file:
+                yield entry.name, file.read()
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that can be changed while tasks are waiting on it.
+
+    `decrease` halves the limit after a rate limit response and `increase` adds
+    one after a run of successes, between `minimum` and `maximum`.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.active = 0
+        self._condition = None
+
+    def decrease(self):
+        self.limit = max(self.minimum, self.limit // 2)
+
+    def increase(self):
+        self.limit = min(self.maximum, self.limit + 1)
+
+    async def __aenter__(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+
+class TrackedLLM:
+    """
+    LightRAG `llm_model_func` that limits concurrency, retries rate limits and
+    attributes token usage to documents.
+
+    Requests go through the shared async client with at most `limit.limit` in
+    flight; a rate limit (429) response halves the limit and is retried after
+    `Retry-After` or an exponential backoff, and every `limit.limit` successful
+    calls in a row raise it by one again. Extraction prompts contain the chunk
+    text, so each call's usage is charged to the registered document whose text
+    snippets it contains, or to `shared` (e.g. description merges).
+    """
+
+    def __init__(self, model: str = GRAPHRAG_LLM_MODEL, max_retries: int = 8):
+        self.model = model
+        self.max_retries = max_retries
+        self.client = async_client.with_options(max_retries=0)
+        self.limit = AdaptiveLimit(
+            GRAPHRAG_MAX_LLM_CONCURRENCY, 1, GRAPHRAG_MAX_LLM_CONCURRENCY
+        )
+        self.usage = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        self.stats = {"requests": 0, "rate_limited": 0}
+        self._snippets = {}
+        self._successes = 0
+
+    def register(self, doc_id: str, text: str, count: int = 8, size: int = 60):
+        step = max(1, (len(text) - size) // count)
+        self._snippets[doc_id] = [
+            text[i : i + size] for i in range(0, max(1, len(text) - size), step)
+        ][:count]
+
+    def unregister(self, doc_id: str):
+        self._snippets.pop(doc_id, None)
+
+    def _document_of(self, text: str) -> str:
+        best, best_matches = "shared", 0
+        for doc_id, snippets in self._snippets.items():
+            matches = sum(snippet in text for snippet in snippets)
+            if matches > best_matches:
+                best, best_matches = doc_id, matches
+        return best
+
+    async def __call__(self, prompt, system_prompt=None, history_messages=None, **kwargs):
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.extend(history_messages or [])
+        messages.append({"role": "user", "content": prompt})
+        if kwargs.pop("keyword_extraction", False):
+            kwargs["response_format"] = {"type": "json_object"}
+        arguments = {k: v for k, v in kwargs.items() if k in LLM_ARGUMENTS}
+
+        backoff = 1.0
+        for attempt in range(self.max_retries + 1):
+            async with self.limit:
+                try:
+                    self.stats["requests"] += 1
+                    response = await self.client.chat.completions.create(
+                        model=self.model, messages=messages, **arguments
+                    )
+                except RateLimitError as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self.stats["rate_limited"] += 1
+                    self._successes = 0
+                    self.limit.decrease()
+                    retry_after = e.response.headers.get("retry-after")
+                    delay = float(retry_after) if retry_after else backoff
+                    backoff = min(backoff * 2, 60.0)
+                else:
+                    self._successes += 1
+                    if self._successes >= self.limit.limit:
+                        # A full window of requests went through, allow one more
+                        self._successes = 0
+                        self.limit.increase()
+                    break
+            logger.warning(f"LLM rate limited, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay + random.uniform(0, delay / 4))
+
+        if response.usage:
+            text = "\n".join(str(m.get("content", "")) for m in messages)
+            usage = self.usage[self._document_of(text)]
+            usage["calls"] += 1
+            usage["prompt_tokens"] += response.usage.prompt_tokens or 0
+            usage["completion_tokens"] += response.usage.completion_tokens or 0
+        return response.choices[0].message.content
+
+
+def status_of(doc_status) -> str:
+    if not doc_status:
+        return None
+    status = doc_status.get("status")
+    return getattr(status, "value", status)
+
+
+class IngestionDriver:
+    """
+    Streams documents to LightRAG, skipping and resuming by doc status.
+
+    Documents are pulled lazily from an iterator into a bounded queue, and each
+    one is inserted as soon as fewer than `parallel.limit` documents are in the
+    pipeline, so a slow document never holds back the others. Documents already
+    `processed` in `kv_store_doc_status.json` are skipped; failed or interrupted
+    ones are deleted and inserted again. The document parallelism is halved when
+    the LLM or the embeddings were rate limited while a document was indexed and
+    increased by one otherwise. A document that has not finished after
+    `document_timeout` seconds is recorded as failed. `report` keeps the
+    extraction time and token usage of every document.
+    """
+
+    def __init__(
+        self,
+        rag,
+        llm: TrackedLLM,
+        embedding_pipeline,
+        initial_parallel: int = 2,
+        document_timeout: float = GRAPHRAG_DOCUMENT_TIMEOUT_SECONDS,
+    ):
+        self.rag = rag
+        self.llm = llm
+        self.embedding_pipeline = embedding_pipeline
+        self.document_timeout = document_timeout
+        self.parallel = AdaptiveLimit(
+            initial_parallel, GRAPHRAG_MIN_PARALLEL_INSERT, GRAPHRAG_MAX_PARALLEL_INSERT
+        )
+        self.report = []
+        self.stats = {"inserted": 0, "resumed": 0, "skipped": 0, "failed": 0}
+
+    def _rate_limited(self) -> int:
+        return self.llm.stats["rate_limited"] + self.embedding_pipeline.stats["rate_limited"]
+
+    async def _plan(self, doc_id: str) -> bool:
+        # Whether the document still has to be inserted
+        status = status_of(await self.rag.doc_status.get_by_id(doc_id))
+        if status == "processed":
+            self.stats["skipped"] += 1
+            return False
+        if status is not None:
+            # Failed or interrupted, its partial graph data is removed first
+            await self.rag.adelete_by_doc_id(doc_id)
+            self.stats["resumed"] += 1
+        return True
+
+    async def _wait_until_done(self, doc_id: str, timeout: float) -> dict:
+        # `ainsert` returns early when another insert already runs the pipeline,
+        # the running pipeline picks the document up, so wait for its final status
+        deadline = time.monotonic() + timeout
+        while True:
+            doc_status = await self.rag.doc_status.get_by_id(doc_id) or {}
+            status = status_of(doc_status)
+            if status in ("processed", "failed"):
+                return doc_status
+            if time.monotonic() > deadline:
+                # The pipeline died or stalled, move on; the next run resumes it
+                logger.warning(f"{doc_id} still {status} after {timeout:.0f}s, recorded as failed")
+                return {**doc_status, "status": "failed"}
+            if status == "pending":
+                # Not picked up yet, start the pipeline if it went idle
+                await self.rag.apipeline_process_enqueue_documents()
+            await asyncio.sleep(GRAPHRAG_STATUS_POLL_SECONDS)
+
+    async def _insert(self, doc_id: str, text: str):
+        self.llm.register(doc_id, text)
+        rate_limited = self._rate_limited()
+        start = time.perf_counter()
+        try:
+            await self.rag.ainsert(input=text, ids=doc_id)
+            doc_status = await self._wait_until_done(doc_id, self.document_timeout)
+        finally:
+            self.llm.unregister(doc_id)
+        elapsed = time.perf_counter() - start
+
+        metadata = doc_status.get("metadata") or {}
+        if "processing_start_time" in metadata and "processing_end_time" in metadata:
+            seconds = metadata["processing_end_time"] - metadata["processing_start_time"]
+        else:
+            seconds = elapsed
+        status = status_of(doc_status)
+        self.stats["inserted" if status == "processed" else "failed"] += 1
+        usage = self.llm.usage.get(doc_id, {})
+        record = {
+            "doc_id": doc_id,
+            "status": status,
+            "seconds": round(seconds, 1),
+            "llm_calls": usage.get("calls", 0),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        }
+        self.report.append(record)
+        logger.info(f"Document finished: {record}")
+
+        if self._rate_limited() > rate_limited:
+            self.parallel.decrease()
+        else:
+            self.parallel.increase()
+        logger.info(
+            f"Indexed {doc_id} in {elapsed:.1f}s, up to {self.parallel.limit} documents in parallel"
+        )
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            doc_id, text = item
+            async with self.parallel:
+                if await self._plan(doc_id):
+                    await self._insert(doc_id, text)
+
+    async def _feed(self, documents, queue: asyncio.Queue, workers: int):
+        # Blocks while the queue is full, so documents are read as they are needed
+        for document in documents:
+            await queue.put(document)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def run(self, documents):
+        # LightRAG may run every document the driver lets in at the same time
+        self.rag.max_parallel_insert = self.parallel.maximum
+        queue = asyncio.Queue(maxsize=self.parallel.maximum)
+        tasks = [asyncio.create_task(self._feed(documents, queue, self.parallel.maximum))]
+        tasks += [
+            asyncio.create_task(self._worker(queue)) for _ in range(self.parallel.maximum)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # A failed insert stops the feeder and the other workers
+            for task in tasks:
+                task.cancel()
+        return self.report
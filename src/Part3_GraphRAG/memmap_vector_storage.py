@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import base64
+import asyncio
+from typing import Any, final
+from dataclasses import dataclass
+import numpy as np
+from lightrag import kg
+from lightrag.base import BaseVectorStorage
+from lightrag.utils import logger, compute_mdhash_id
+
+STORAGE_NAME = "MemmapVectorDBStorage"
+# NanoVectorDBStorage keeps the vectors in JSON, run this module once to migrate
+GRAPHRAG_VECTOR_STORAGE = os.getenv("GRAPHRAG_VECTOR_STORAGE", "NanoVectorDBStorage")
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def storage_paths(workspace_dir: str, namespace: str):
+    # Vectors and metadata are kept apart: the matrix is memory-mapped, only the
+    # small metadata records are parsed at startup
+    base = os.path.join(workspace_dir, f"vdb_{namespace}")
+    return f"{base}.npy", f"{base}.meta.json", f"{base}.json"
+
+
+def write_storage(vectors_path: str, meta_path: str, matrix: np.ndarray, records: list):
+    # Write to temp files and swap them in, so a crash never leaves half a store
+    np.save(f"{vectors_path}.tmp.npy", np.ascontiguousarray(matrix, dtype=np.float32))
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as file:
+        json.dump({"embedding_dim": matrix.shape[1], "data": records}, file)
+    os.replace(f"{vectors_path}.tmp.npy", vectors_path)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def migrate_from_json(json_path: str, vectors_path: str, meta_path: str) -> int:
+    # NanoVectorDB files hold the whole matrix as base64 float32 plus one record
+    # per row with a compressed copy of its vector, which is dropped here
+    with open(json_path, "r", encoding="utf-8") as file:
+        storage = json.load(file)
+    dim = storage["embedding_dim"]
+    matrix = np.frombuffer(base64.b64decode(storage["matrix"]), dtype=np.float32)
+    matrix = matrix.reshape(-1, dim)
+    records = [
+        {k: v for k, v in record.items() if k not in ("vector", "__vector__")}
+        for record in storage["data"]
+    ]
+    write_storage(vectors_path, meta_path, normalize(matrix), records)
+    return len(records)
+
+
+@final
+@dataclass
+class MemmapVectorDBStorage(BaseVectorStorage):
+    """
+    LightRAG vector storage on a memory-mapped float32 matrix.
+
+    Each namespace is stored as `vdb_<namespace>.npy` (normalized vectors, opened
+    with `mmap_mode="r"`, so startup does not read them) and
+    `vdb_<namespace>.meta.json` (the records, in row order). An existing
+    NanoVectorDB `vdb_<namespace>.json` is migrated on first open. Changes are
+    kept in memory and written at `index_done_callback`.
+    """
+
+    def __post_init__(self):
+        kwargs = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        cosine_threshold = kwargs.get("cosine_better_than_threshold")
+        if cosine_threshold is None:
+            raise ValueError(
+                "cosine_better_than_threshold must be specified in vector_db_storage_cls_kwargs"
+            )
+        self.cosine_better_than_threshold = cosine_threshold
+
+        workspace_dir = self.global_config["working_dir"]
+        if self.workspace:
+            workspace_dir = os.path.join(workspace_dir, self.workspace)
+        os.makedirs(workspace_dir, exist_ok=True)
+        self._vectors_path, self._meta_path, self._json_path = storage_paths(
+            workspace_dir, self.namespace
+        )
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._dim = self.embedding_func.embedding_dim
+        self._lock = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._vectors_path) and os.path.exists(self._json_path):
+            count = migrate_from_json(self._json_path, self._vectors_path, self._meta_path)
+            logger.info(f"Migrated {count} vectors of {self.namespace} to {self._vectors_path}")
+
+        if os.path.exists(self._vectors_path):
+            self._matrix = np.load(self._vectors_path, mmap_mode="r")
+            with open(self._meta_path, "r", encoding="utf-8") as file:
+                self._records = json.load(file)["data"]
+        else:
+            self._matrix = np.zeros((0, self._dim), dtype=np.float32)
+            self._records = []
+        self._rows = {record["__id__"]: i for i, record in enumerate(self._records)}
+        self._dirty = False
+
+    def _writable(self):
+        # The first change copies the memory-mapped matrix into memory
+        if not self._dirty:
+            self._matrix = np.array(self._matrix)
+            self._dirty = True
+
+    async def initialize(self):
+        self._lock = asyncio.Lock()
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        current_time = int(time.time())
+        contents = [v["content"] for v in data.values()]
+        batches = [
+            contents[i : i + self._max_batch_size]
+            for i in range(0, len(contents), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *(self.embedding_func(batch) for batch in batches)
+        )
+        embeddings = normalize(np.concatenate(embeddings_list).astype(np.float32))
+        if len(embeddings) != len(data):
+            logger.error(
+                f"[{self.namespace}] embedding is not 1-1 with data, {len(embeddings)} != {len(data)}"
+            )
+            return
+
+        async with self._lock:
+            self._writable()
+            new_rows = []
+            for (key, value), embedding in zip(data.items(), embeddings):
+                record = {
+                    "__id__": key,
+                    "__created_at__": current_time,
+                    **{k: v for k, v in value.items() if k in self.meta_fields},
+                }
+                if key in self._rows:
+                    row = self._rows[key]
+                    self._records[row] = record
+                    self._matrix[row] = embedding
+                else:
+                    self._rows[key] = len(self._records)
+                    self._records.append(record)
+                    new_rows.append(embedding)
+            if new_rows:
+                self._matrix = np.vstack([self._matrix, np.array(new_rows)])
+
+    def _format(self, record: dict, distance: float = None) -> dict:
+        result = {**record, "id": record["__id__"], "created_at": record.get("__created_at__")}
+        if distance is not None:
+            result["distance"] = distance
+        return result
+
+    async def query(
+        self, query: str, top_k: int, query_embedding: list[float] = None
+    ) -> list[dict[str, Any]]:
+        if query_embedding is None:
+            query_embedding = (await self.embedding_func([query]))[0]
+        if not self._records or top_k <= 0:
+            return []
+        embedding = normalize(np.asarray(query_embedding, dtype=np.float32))
+        scores = self._matrix @ embedding
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            self._format(self._records[i], float(scores[i]))
+            for i in top
+            if scores[i] >= self.cosine_better_than_threshold
+        ]
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        row = self._rows.get(id)
+        return self._format(self._records[row]) if row is not None else None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        return [
+            self._format(self._records[self._rows[id]]) for id in ids if id in self._rows
+        ]
+
+    async def get_vectors_by_ids(self, ids: list[str]) -> dict[str, list[float]]:
+        return {
+            id: self._matrix[self._rows[id]].tolist() for id in ids if id in self._rows
+        }
+
+    async def delete(self, ids: list[str]):
+        ids = set(ids)
+        async with self._lock:
+            keep = [i for i, r in enumerate(self._records) if r["__id__"] not in ids]
+            if len(keep) == len(self._records):
+                return
+            self._writable()
+            self._matrix = self._matrix[keep]
+            self._records = [self._records[i] for i in keep]
+            self._rows = {r["__id__"]: i for i, r in enumerate(self._records)}
+
+    async def delete_entity(self, entity_name: str) -> None:
+        await self.delete([compute_mdhash_id(entity_name, prefix="ent-")])
+
+    async def delete_entity_relation(self, entity_name: str) -> None:
+        await self.delete(
+            [
+                r["__id__"]
+                for r in self._records
+                if entity_name in (r.get("src_id"), r.get("tgt_id"))
+            ]
+        )
+
+    async def index_done_callback(self) -> bool:
+        async with self._lock:
+            if not self._dirty:
+                return True
+            try:
+                write_storage(self._vectors_path, self._meta_path, self._matrix, self._records)
+                self._load()
+                return True
+            except Exception as e:
+                logger.error(f"Error saving data for {self.namespace}: {e}")
+                return False
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            async with self._lock:
+                for path in (self._vectors_path, self._meta_path, self._json_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._matrix = np.zeros((0, self._dim), dtype=np.float32)
+                self._records, self._rows, self._dirty = [], {}, True
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+
+def register_memmap_storage():
+    # LightRAG looks custom storages up by name in these registries
+    kg.STORAGES[STORAGE_NAME] = "src.Part3_GraphRAG.memmap_vector_storage"
+    kg.STORAGE_ENV_REQUIREMENTS[STORAGE_NAME] = []
+    implementations = kg.STORAGE_IMPLEMENTATIONS["VECTOR_STORAGE"]["implementations"]
+    if STORAGE_NAME not in implementations:
+        implementations.append(STORAGE_NAME)
+
+
+register_memmap_storage()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    source_dir = Path(__file__).resolve().parent.parent.parent
+    working_dir = os.path.join(source_dir, "data/lightrag_storage/")
+
+    # One-shot migration of the NanoVectorDB JSON files, they are kept as a backup
+    for namespace in ["entities", "relationships", "chunks"]:
+        vectors_path, meta_path, json_path = storage_paths(working_dir, namespace)
+        if not os.path.exists(json_path):
+            continue
+        count = migrate_from_json(json_path, vectors_path, meta_path)
+        print(
+            f"{namespace}: {count} vectors, {os.path.getsize(json_path) / 1024:.0f} KB JSON -> "
+            f"{os.path.getsize(vectors_path) / 1024:.0f} KB vectors + "
+            f"{os.path.getsize(meta_path) / 1024:.0f} KB metadata"
+        )
+    print(f"Set GRAPHRAG_VECTOR_STORAGE={STORAGE_NAME} to use the migrated storage")
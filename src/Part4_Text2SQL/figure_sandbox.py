@@ -0,0 +1,377 @@
+import os
+import sys
+import json
+import math
+import time
+import queue
+import signal
+import asyncio
+import builtins
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, only the wall-clock limit applies there
+    resource = None
+
+# Worker processes that run the generated chart code
+FIGURE_WORKERS = int(os.getenv("FIGURE_WORKERS", 2))
+# Wall-clock and CPU time limits for one chart, counted from when a worker takes it
+FIGURE_TIMEOUT_SECONDS = float(os.getenv("FIGURE_TIMEOUT_SECONDS", 5))
+FIGURE_CPU_SECONDS = float(os.getenv("FIGURE_CPU_SECONDS", 2))
+# Memory a worker may allocate on top of what it uses after importing plotly
+FIGURE_MEMORY_MB = int(os.getenv("FIGURE_MEMORY_MB", 512))
+# Largest figure JSON sent back to the app
+FIGURE_MAX_JSON_BYTES = int(os.getenv("FIGURE_MAX_JSON_BYTES", 2_000_000))
+
+# Extra time the app waits for a worker to report its own limit errors
+GRACE_SECONDS = 1.0
+# How long a new worker may take to import plotly
+STARTUP_SECONDS = 60.0
+# How long a chart may wait for a free worker
+QUEUE_SECONDS = 30.0
+
+# Environment variables a worker keeps. Everything else, including the API keys
+# that load_dotenv put into the app's environment, is left out
+WORKER_ENVIRONMENT = ("PATH", "SYSTEMROOT", "LANG", "LC_ALL", "TMPDIR", "TEMP", "TMP")
+
+# Top-level packages the generated code may import. This catches a model that
+# reaches for pandas or os by mistake; it is not a security boundary, since any
+# module exposes the real builtins. The isolation comes from the worker process:
+# no credentials in its environment, no file writes, no child processes, and
+# CPU, memory and output limits
+ALLOWED_IMPORTS = {
+    "plotly",
+    "math",
+    "statistics",
+    "datetime",
+    "collections",
+    "itertools",
+    "json",
+}
+
+# Builtins the generated code has no use for
+BLOCKED_BUILTINS = {
+    "open",
+    "exec",
+    "eval",
+    "compile",
+    "input",
+    "breakpoint",
+    "help",
+    "exit",
+    "quit",
+}
+
+
+class FigureLimitError(Exception):
+    pass
+
+
+def _limited_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name.split(".")[0] not in ALLOWED_IMPORTS:
+        raise ImportError(f"import of '{name}' is not allowed in chart code")
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+def _safe_builtins() -> dict:
+    safe = {k: v for k, v in vars(builtins).items() if k not in BLOCKED_BUILTINS}
+    safe["__import__"] = _limited_import
+    return safe
+
+
+def _on_limit(signum, frame):
+    if signum == signal.SIGPROF:
+        raise FigureLimitError("chart code exceeded its CPU time limit")
+    raise FigureLimitError("chart code exceeded its time limit")
+
+
+def _virtual_memory_bytes() -> int:
+    with open("/proc/self/statm", "r") as file:
+        return int(file.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _init_worker(memory_mb: int):
+    # Runs once per worker: import plotly up front so every chart starts warm,
+    # then set the limits that hold for the rest of the worker's life
+    import plotly.graph_objects  # noqa: F401
+    import plotly.io  # noqa: F401
+
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGPROF, _on_limit)
+        signal.signal(signal.SIGALRM, _on_limit)
+    if resource is None:
+        return
+    # No file writes and no child processes
+    for limit in (resource.RLIMIT_FSIZE, resource.RLIMIT_NPROC):
+        try:
+            resource.setrlimit(limit, (0, 0))
+        except (OSError, ValueError):
+            pass
+    if memory_mb:
+        try:
+            limit = _virtual_memory_bytes() + memory_mb * 2**20
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (OSError, ValueError):
+            # No /proc (macOS) or the limit is not supported
+            pass
+
+
+def _arm(cpu_seconds: float, timeout_seconds: float):
+    if hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_PROF, cpu_seconds)
+        signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+    if resource is not None:
+        # Backstop for code stuck inside a C call, where the timers cannot raise:
+        # SIGXCPU ends the worker one second after the CPU limit
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _disarm():
+    if hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    if resource is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def run_figure_code(code: str, cpu_seconds: float, timeout_seconds: float, max_json_bytes: int):
+    # Runs in a worker process; returns (figure_json, error)
+    import plotly.graph_objects as go
+
+    namespace = {"__builtins__": _safe_builtins(), "go": go}
+    try:
+        _arm(cpu_seconds, timeout_seconds)
+        try:
+            exec(code, namespace)
+            fig = namespace.get("fig")
+            if isinstance(fig, dict):
+                fig = go.Figure(fig)
+            if not isinstance(fig, go.Figure):
+                return None, "Error: the chart code did not create a figure named 'fig'"
+            figure_json = fig.to_json()
+        finally:
+            _disarm()
+    except MemoryError:
+        return None, "Error: chart code exceeded its memory limit"
+    except Exception as e:
+        return None, f"Error: {str(e)}"
+    except BaseException as e:
+        # SystemExit and the like must not end the worker or reach the app
+        return None, f"Error: chart code raised {e.__class__.__name__}"
+
+    if len(figure_json) > max_json_bytes:
+        return None, (
+            f"Error: figure JSON is {len(figure_json)} bytes, "
+            f"over the {max_json_bytes} byte limit"
+        )
+    return figure_json, None
+
+
+def serve(memory_mb: int):
+    # Worker loop: one JSON job per line on stdin, one JSON reply per line on
+    # the original stdout; prints of the chart code go to devnull instead
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    sys.stdout = open(os.devnull, "w")
+
+    _init_worker(memory_mb)
+    pid = os.getpid()
+    replies.write(json.dumps({"ready": True}) + "\n")
+    replies.flush()
+    for line in sys.stdin:
+        job = json.loads(line)
+        figure_json, error = run_figure_code(
+            job["code"], job["cpu_seconds"], job["timeout_seconds"], job["max_json_bytes"]
+        )
+        if os.getpid() != pid:
+            # A process forked by the chart code (RLIMIT_NPROC does not bind root)
+            os._exit(0)
+        replies.write(json.dumps({"id": job["id"], "figure": figure_json, "error": error}) + "\n")
+        replies.flush()
+
+
+class FigureWorker:
+    """
+    One worker process, started from this file in isolated mode (`python -I`)
+    with only `WORKER_ENVIRONMENT` and an empty temp directory as working
+    directory. A reader thread collects its replies, so a reply can be awaited
+    with a timeout.
+    """
+
+    def __init__(self, memory_mb: int):
+        env = {name: os.environ[name] for name in WORKER_ENVIRONMENT if name in os.environ}
+        self._cwd = tempfile.TemporaryDirectory(prefix="figure_worker_")
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", str(Path(__file__).resolve()), str(memory_mb)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self._cwd.name,
+            env=env,
+            text=True,
+            encoding="utf-8",
+        )
+        self._replies = queue.Queue()
+        self._ready = False
+        self._job_id = 0
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self._replies.put(line)
+        # The process ended
+        self._replies.put(None)
+
+    def _reply(self, timeout: float) -> dict:
+        line = self._replies.get(timeout=timeout)
+        if line is None:
+            raise EOFError("chart worker stopped")
+        return json.loads(line)
+
+    def call(self, job: dict, timeout: float) -> dict:
+        # Raises queue.Empty when the worker hangs, EOFError/OSError/ValueError
+        # when it died or broke the protocol
+        if not self._ready:
+            self._reply(STARTUP_SECONDS)
+            self._ready = True
+        self._job_id += 1
+        self.process.stdin.write(json.dumps({**job, "id": self._job_id}) + "\n")
+        self.process.stdin.flush()
+        deadline = time.monotonic() + timeout
+        while True:
+            reply = self._reply(max(0.0, deadline - time.monotonic()))
+            # Replies of earlier jobs, e.g. written by a forked child, are dropped
+            if reply.get("id") == self._job_id:
+                return reply
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self._cwd.cleanup()
+
+
+class FigureSandbox:
+    """
+    Pool of pre-warmed worker processes that run LLM-generated Plotly code.
+
+    Each worker imports plotly once and caps its address space at `memory_mb`
+    above that baseline. The workers get no API keys and cannot write files or
+    start processes. They can still read files the app user can read, so
+    secrets belong in the environment, not in readable files. Each chart gets a
+    CPU time and a wall-clock limit, which start when a worker takes the chart.
+    It comes back as figure JSON of at most `max_json_bytes`. A worker that
+    hangs past its limits (e.g. inside a C call) or dies is replaced on its own;
+    the other workers and their charts carry on.
+    """
+
+    def __init__(
+        self,
+        workers: int = FIGURE_WORKERS,
+        timeout_seconds: float = FIGURE_TIMEOUT_SECONDS,
+        cpu_seconds: float = FIGURE_CPU_SECONDS,
+        memory_mb: int = FIGURE_MEMORY_MB,
+        max_json_bytes: int = FIGURE_MAX_JSON_BYTES,
+    ):
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_json_bytes = max_json_bytes
+        self._idle = None
+        self._all = set()
+        self._lock = threading.Lock()
+        self.stats = {"runs": 0, "figures": 0, "errors": 0, "timeouts": 0, "restarts": 0}
+
+    def start(self):
+        # Starts every worker now; they import plotly while the app goes on
+        with self._lock:
+            if self._idle is None:
+                self._idle = queue.Queue()
+                for _ in range(self.workers):
+                    worker = FigureWorker(self.memory_mb)
+                    self._all.add(worker)
+                    self._idle.put(worker)
+            return self._idle
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._all, self._idle = self._all, set(), None
+        for worker in workers:
+            worker.kill()
+
+    def _replace(self, worker: FigureWorker) -> FigureWorker:
+        worker.kill()
+        with self._lock:
+            self._all.discard(worker)
+            if self._idle is None:
+                # Shut down meanwhile
+                return None
+            self.stats["restarts"] += 1
+            replacement = FigureWorker(self.memory_mb)
+            self._all.add(replacement)
+            return replacement
+
+    def run(self, code: str) -> tuple:
+        # Returns (figure_json, error), exactly one of them is None
+        idle = self.start()
+        try:
+            worker = idle.get(timeout=QUEUE_SECONDS)
+        except queue.Empty:
+            self.stats["errors"] += 1
+            return None, "Error: all chart workers are busy"
+
+        self.stats["runs"] += 1
+        job = {
+            "code": code,
+            "cpu_seconds": self.cpu_seconds,
+            "timeout_seconds": self.timeout_seconds,
+            "max_json_bytes": self.max_json_bytes,
+        }
+        try:
+            reply = worker.call(job, self.timeout_seconds + GRACE_SECONDS)
+        except queue.Empty:
+            self.stats["errors"] += 1
+            self.stats["timeouts"] += 1
+            worker = self._replace(worker)
+            return None, "Error: chart code did not finish in time"
+        except (EOFError, OSError, ValueError):
+            # e.g. ended by the CPU backstop in _arm
+            self.stats["errors"] += 1
+            worker = self._replace(worker)
+            return None, "Error: chart worker stopped, over its CPU or memory limit"
+        finally:
+            if worker is not None:
+                idle.put(worker)
+
+        if reply["error"]:
+            self.stats["errors"] += 1
+        else:
+            self.stats["figures"] += 1
+        return reply["figure"], reply["error"]
+
+    async def arun(self, code: str) -> tuple:
+        # Async variant of run, waits on a worker thread
+        return await asyncio.to_thread(self.run, code)
+
+
+figure_sandbox = FigureSandbox()
+
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else FIGURE_MEMORY_MB)
@@ -0,0 +1,274 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+import numpy as np
+from src.Common.llm_clients import client, async_client
+from src.Common.embedding_cache import embedding_cache
+from src.Common.question_literals import same_literals, words_in
+
+source_dir = Path(__file__).resolve().parent.parent.parent
+ROUTES_DB_PATH = os.path.join(source_dir, "data/sql_routes.db")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Below this similarity the question goes to the model
+SQL_ROUTE_THRESHOLD = float(os.getenv("SQL_ROUTE_THRESHOLD", 0.9))
+# Stricter bar for learned (unreviewed, LLM generated) queries
+SQL_LEARNED_ROUTE_THRESHOLD = float(os.getenv("SQL_LEARNED_ROUTE_THRESHOLD", 0.97))
+# Learned queries expire, and only the most recent ones are kept
+SQL_ROUTE_TTL_SECONDS = int(os.getenv("SQL_ROUTE_TTL_SECONDS", 7 * 24 * 60 * 60))
+SQL_ROUTE_MAX_LEARNED = int(os.getenv("SQL_ROUTE_MAX_LEARNED", 500))
+SQL_ROUTER_ENABLED = os.getenv("SQL_ROUTER_ENABLED", "true").lower() == "true"
+
+# Templated queries for the common aggregates over the members table
+SEED_ROUTES = [
+    ("how many members in the community?", "SELECT COUNT(*) AS members FROM members"),
+    (
+        "how many members per institution?",
+        "SELECT institution, COUNT(*) AS members FROM members "
+        "GROUP BY institution ORDER BY members DESC LIMIT 10",
+    ),
+    (
+        "what is the average years of experience of the members?",
+        "SELECT ROUND(AVG(total_years_experience), 1) AS average_years_experience "
+        "FROM members",
+    ),
+    (
+        "how many members per highest degree?",
+        "SELECT highest_degree, COUNT(*) AS members FROM members "
+        "GROUP BY highest_degree ORDER BY members DESC LIMIT 10",
+    ),
+    (
+        "how many members per current company?",
+        "SELECT current_company, COUNT(*) AS members FROM members "
+        "WHERE current_company IS NOT NULL "
+        "GROUP BY current_company ORDER BY members DESC LIMIT 10",
+    ),
+    (
+        "how many members per years of experience bucket?",
+        "SELECT years_experience_bucket, COUNT(*) AS members FROM members "
+        "GROUP BY years_experience_bucket ORDER BY members DESC LIMIT 10",
+    ),
+    (
+        "how many members per current status?",
+        "SELECT current_status, COUNT(*) AS members FROM members "
+        "GROUP BY current_status ORDER BY members DESC LIMIT 10",
+    ),
+]
+
+
+SEED_QUESTIONS = {question for question, _ in SEED_ROUTES}
+
+# Words that do not change which SQL a question needs
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "for", "to", "by", "per", "and", "or",
+    "is", "are", "was", "were", "be", "do", "does", "did", "there", "what", "which",
+    "who", "how", "many", "much", "me", "show", "list", "give", "tell", "please",
+    "our", "community", "members", "member",
+}
+
+
+def content_words(text: str) -> set:
+    # Plural and singular count as the same word
+    return {word.rstrip("s") for word in words_in(text) if word not in STOPWORDS}
+
+
+class QueryRouter:
+    """
+    Fast path of Text-to-SQL: reuses the SQL of an earlier, similar question.
+
+    Question -> SQL pairs (the templated `SEED_ROUTES` plus LLM generated queries
+    that ran successfully) are stored on local SQLite with the question
+    embedding. A question gets the SQL of its most similar stored question
+    without a model call when both mention the same literals (numbers, quoted
+    values, capitalized names) and negations, and the similarity is above
+    `threshold` for a seed. A learned route must also be above the stricter
+    `learned_threshold` and have the same content words, so only rephrasings
+    of the same question reuse it; learned routes expire after `ttl_seconds`
+    and at most `max_learned` are kept. `stats` counts hits and misses and the
+    time spent on each path.
+    """
+
+    def __init__(
+        self,
+        db_path: str = ROUTES_DB_PATH,
+        threshold: float = SQL_ROUTE_THRESHOLD,
+        learned_threshold: float = SQL_LEARNED_ROUTE_THRESHOLD,
+        ttl_seconds: int = SQL_ROUTE_TTL_SECONDS,
+        max_learned: int = SQL_ROUTE_MAX_LEARNED,
+        enabled: bool = SQL_ROUTER_ENABLED,
+    ):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.learned_threshold = learned_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_learned = max_learned
+        self.enabled = enabled
+        self.stats = {"hits": 0, "misses": 0, "hit_seconds": 0.0, "miss_seconds": 0.0}
+        self._lock = threading.Lock()
+        self._conn = None
+        # (questions, queries, embedding matrix, created_at), rebuilt after a
+        # route is stored
+        self._routes = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sql_routes (
+                    question TEXT PRIMARY KEY,
+                    sql_query TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+        return self._conn
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _embed(self, text: str) -> np.ndarray:
+        found = embedding_cache.get_many(EMBEDDING_MODEL, [text])
+        if text not in found:
+            start = time.perf_counter()
+            response = client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+            found[text] = response.data[0].embedding
+            embedding_cache.set_many(
+                EMBEDDING_MODEL, [text], [found[text]], time.perf_counter() - start
+            )
+        return self._normalize(found[text])
+
+    async def _aembed(self, text: str) -> np.ndarray:
+        found = await embedding_cache.aget_many(EMBEDDING_MODEL, [text])
+        if text not in found:
+            start = time.perf_counter()
+            response = await async_client.embeddings.create(
+                model=EMBEDDING_MODEL, input=text
+            )
+            found[text] = response.data[0].embedding
+            await embedding_cache.aset_many(
+                EMBEDDING_MODEL, [text], [found[text]], time.perf_counter() - start
+            )
+        return self._normalize(found[text])
+
+    def _load(self):
+        # Routes are few, keep them in memory as one matrix
+        if self._routes is not None:
+            return self._routes
+        with self._lock:
+            conn = self._connection()
+            stored = {
+                row[0]
+                for row in conn.execute("SELECT question FROM sql_routes").fetchall()
+            }
+        for question, sql_query in SEED_ROUTES:
+            if question not in stored:
+                self._store(question, sql_query, self._embed(question))
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT question, sql_query, embedding, created_at FROM sql_routes"
+            ).fetchall()
+            self._routes = (
+                [row[0] for row in rows],
+                [row[1] for row in rows],
+                np.vstack([np.frombuffer(row[2], dtype=np.float32) for row in rows]),
+                np.array([row[3] for row in rows]),
+            )
+            return self._routes
+
+    def _store(self, question: str, sql_query: str, embedding: np.ndarray):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO sql_routes (question, sql_query, embedding, created_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (question, sql_query, embedding.tobytes(), time.time()),
+            )
+            # Drop expired learned routes and keep the newest max_learned
+            seeds = list(SEED_QUESTIONS)
+            placeholders = ",".join("?" * len(seeds))
+            conn.execute(
+                f"DELETE FROM sql_routes WHERE question NOT IN ({placeholders}) "
+                "AND created_at < ?",
+                (*seeds, time.time() - self.ttl_seconds),
+            )
+            conn.execute(
+                f"""
+                DELETE FROM sql_routes WHERE question IN (
+                    SELECT question FROM sql_routes WHERE question NOT IN ({placeholders})
+                    ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (*seeds, self.max_learned),
+            )
+            conn.commit()
+            self._routes = None
+
+    def _match(self, routes, question: str, embedding: np.ndarray):
+        questions, queries, matrix, created_at = routes
+        similarities = matrix @ embedding
+        seeds = np.array([q in SEED_QUESTIONS for q in questions])
+        # Learned routes past their TTL are not used, even before they are deleted
+        expired = ~seeds & (created_at < time.time() - self.ttl_seconds)
+        similarities = np.where(expired, -1.0, similarities)
+        best = int(np.argmax(similarities))
+        stored = questions[best]
+        threshold = self.threshold if seeds[best] else self.learned_threshold
+        if similarities[best] < threshold:
+            return None
+        # "top 5" vs "top 10", "at Google" vs "at Microsoft" and negated questions
+        # embed close together but need different SQL
+        if not same_literals(question, stored):
+            return None
+        if not seeds[best] and content_words(question) != content_words(stored):
+            return None
+        return queries[best], float(similarities[best])
+
+    def route(self, question: str):
+        # Returns (sql_query, similarity), or None when the model has to write it
+        if not self.enabled:
+            return None
+        return self._match(self._load(), question, self._embed(question))
+
+    async def aroute(self, question: str):
+        if not self.enabled:
+            return None
+        routes = self._routes or await asyncio.to_thread(self._load)
+        return self._match(routes, question, await self._aembed(question))
+
+    def learn(self, question: str, sql_query: str):
+        # Called once a generated query ran successfully
+        if self.enabled:
+            self._store(question, sql_query, self._embed(question))
+
+    def record(self, hit: bool, seconds: float):
+        if hit:
+            self.stats["hits"] += 1
+            self.stats["hit_seconds"] += seconds
+        else:
+            self.stats["misses"] += 1
+            self.stats["miss_seconds"] += seconds
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def report(self) -> str:
+        hits, misses = self.stats["hits"], self.stats["misses"]
+        hit_ms = self.stats["hit_seconds"] / hits * 1000 if hits else 0.0
+        miss_ms = self.stats["miss_seconds"] / misses * 1000 if misses else 0.0
+        return (
+            f"{hits} routed, {misses} sent to the model (hit rate {self.hit_rate():.0%}), "
+            f"avg {hit_ms:.0f}ms routed vs {miss_ms:.0f}ms through the model"
+        )
+
+
+query_router = QueryRouter()
@@ -1,22 +1,30 @@
 import os
+import re
+import math
+import time
+import asyncio
+import logging
+import threading
 from pathlib import Path
-from openai import OpenAI
-from dotenv import load_dotenv
+from contextlib import contextmanager
 from pydantic import BaseModel, Field
 import sqlite3
 import pandas as pd
 import plotly.graph_objects as go
-
-# Load environment variables from .env file
-load_dotenv()
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Initialize OpenAI client with GitHub Models
-client = OpenAI(
-    base_url=OPENAI_API_BASE,
-    api_key=OPENAI_API_KEY,
+import plotly.io as pio
+from src.Common.llm_clients import client, async_client, record_usage
+from src.Common.tracing import span, traced
+from src.Common.llm_cache import (
+    llm_cache,
+    split_messages,
+    cached_completion,
+    acached_completion,
+    astream_cached_completion,
 )
+from src.Part4_Text2SQL.query_router import query_router
+from src.Part4_Text2SQL.figure_sandbox import figure_sandbox
+
+logger = logging.getLogger(__name__)
 
 
 class SQLQueryOutput(BaseModel):
@@ -24,8 +32,7 @@ class SQLQueryOutput(BaseModel):
     explanation: str = Field(description="An optional explanation of the query.")
 
 
-# Function to run chat completion
-def write_sql_query(question: str) -> str:
+def build_sql_query_messages(question: str, feedback: tuple = None) -> list:
     SYSTEM_PROMPT = """
         You are a helpful assistant that creates SQL queries based on the user question and database schema provided.
         """
@@ -49,8 +56,9 @@ def write_sql_query(question: str) -> str:
         - linkedin_url (TEXT)
         """
 
-    CREATE_QUERY_PROMPT_TEMPLATE = """
-        Given the following input {question}, create a syntactically correct sqlite query to help find the answer. 
+    # Instructions and schema are static, they go first as a cacheable prompt prefix
+    CREATE_QUERY_INSTRUCTIONS_TEMPLATE = """
+        Given the user question, create a syntactically correct sqlite query to help find the answer. 
         Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most 10 results. 
         You can order the results by a relevant column to return the most meaningful or interesting examples in the database.
 
@@ -66,44 +74,337 @@ def write_sql_query(question: str) -> str:
         {database_schema_context}
         """
 
-    USER_PROMPT = CREATE_QUERY_PROMPT_TEMPLATE.format(
-        question=question, database_schema_context=DB_SCHEMA_CONTEXT
+    CREATE_QUERY_PROMPT_TEMPLATE = """
+        Question: {question}
+        """
+
+    REJECTED_QUERY_PROMPT_TEMPLATE = """
+        The previous query was rejected and must not be repeated:
+        {rejected_query}
+
+        Reason: {reason}
+
+        Write a different query that avoids this problem, for example by removing cross joins or by filtering and aggregating earlier.
+        """
+
+    SYSTEM_PROMPT += CREATE_QUERY_INSTRUCTIONS_TEMPLATE.format(
+        database_schema_context=DB_SCHEMA_CONTEXT
     )
+    USER_PROMPT = CREATE_QUERY_PROMPT_TEMPLATE.format(question=question)
+    if feedback:
+        rejected_query, reason = feedback
+        USER_PROMPT += REJECTED_QUERY_PROMPT_TEMPLATE.format(
+            rejected_query=rejected_query, reason=reason
+        )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT},
+    ]
+
+
+# Function to run chat completion
+@traced("text2sql.write")
+def write_sql_query(question: str, feedback: tuple = None) -> str:
+    messages = build_sql_query_messages(question, feedback)
+    system_prompt, user_prompt = split_messages(messages)
     try:
+        cached, embedding = llm_cache.get(
+            "gpt-4o-mini", system_prompt, user_prompt, question
+        )
+        if cached is not None:
+            return SQLQueryOutput.model_validate_json(cached)
+
         response = client.chat.completions.parse(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": USER_PROMPT},
-            ],
+            messages=messages,
             response_format=SQLQueryOutput,
         )
 
-        return response.choices[0].message.parsed
+        record_usage("gpt-4o-mini", response.usage)
+        parsed = response.choices[0].message.parsed
+        llm_cache.set(
+            "gpt-4o-mini",
+            system_prompt,
+            user_prompt,
+            parsed.model_dump_json(),
+            embedding,
+            question,
+        )
+        return parsed
 
     except Exception as e:
         return f"Error: {str(e)}"
 
 
-def run_sql_query(query: str):
+@traced("text2sql.write")
+async def awrite_sql_query(question: str, feedback: tuple = None) -> str:
+    messages = build_sql_query_messages(question, feedback)
+    system_prompt, user_prompt = split_messages(messages)
+    try:
+        cached, embedding = await llm_cache.aget(
+            "gpt-4o-mini", system_prompt, user_prompt, question
+        )
+        if cached is not None:
+            return SQLQueryOutput.model_validate_json(cached)
+
+        response = await async_client.chat.completions.parse(
+            model="gpt-4o-mini",
+            messages=messages,
+            response_format=SQLQueryOutput,
+        )
 
-    # Connect to the SQLite database
-    # Get the directory where this script is located
-    source_dir = Path(__file__).resolve().parent.parent.parent
-    db_path = os.path.join(source_dir, "data/data.db")
-    conn = sqlite3.connect(db_path)
+        record_usage("gpt-4o-mini", response.usage)
+        parsed = response.choices[0].message.parsed
+        await llm_cache.aset(
+            "gpt-4o-mini",
+            system_prompt,
+            user_prompt,
+            parsed.model_dump_json(),
+            embedding,
+            question,
+        )
+        return parsed
 
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+source_dir = Path(__file__).resolve().parent.parent.parent
+DB_PATH = os.path.join(source_dir, "data/data.db")
+
+# Upper bound on the rows a single (LLM generated) query may return
+MAX_ROWS = 500
+
+# Queries whose estimated cost (rows visited) is above this are not run
+MAX_QUERY_COST = int(os.getenv("SQL_MAX_QUERY_COST", 1_000_000))
+# Wall-clock limit for running a query and fetching its rows
+QUERY_TIMEOUT_SECONDS = float(os.getenv("SQL_QUERY_TIMEOUT_SECONDS", 5))
+# How many times the model may regenerate a rejected query
+MAX_SQL_ATTEMPTS = 3
+
+QUERY_REJECTED_PREFIX = "Query rejected: "
+
+# One read-only connection per thread, reused across queries
+_connections = threading.local()
+_table_rows = {}
+
+
+def get_connection():
+    conn = getattr(_connections, "conn", None)
+    if conn is None:
+        # mode=ro opens the file read-only, query_only also rejects writes that
+        # would go through an attached database; readers never block WAL writers
+        conn = sqlite3.connect(f"{Path(DB_PATH).as_uri()}?mode=ro", uri=True)
+        conn.execute("PRAGMA query_only = ON")
+        _connections.conn = conn
+    return conn
+
+
+def close_connection():
+    conn = getattr(_connections, "conn", None)
+    if conn is not None:
+        conn.close()
+        _connections.conn = None
+
+
+def get_table_rows(conn) -> dict:
+    # Row count per table, read once per process for the cost estimate
+    if not _table_rows:
+        tables = conn.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        for (table,) in tables:
+            count = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            _table_rows[table] = count
+    return _table_rows
+
+
+def plan_cost(children: dict, parent: int, table_rows: dict, default_rows: int) -> float:
+    # Loops of one SELECT are nested in join order and multiply; subqueries and
+    # the parts of a compound query run on their own and add up
+    loops, subqueries = 1.0, 0.0
+    for node_id, detail in children.get(parent, []):
+        if node_id in children:
+            cost = plan_cost(children, node_id, table_rows, default_rows)
+            if detail.startswith("CORRELATED"):
+                # Runs again for every row of the loops before it
+                cost *= loops
+            subqueries += cost
+            continue
+        match = re.match(r"(SCAN|SEARCH) (\S+)", detail)
+        if not match or match.group(2) == "CONSTANT":
+            continue
+        rows = table_rows.get(match.group(2), default_rows)
+        if match.group(1) == "SCAN":
+            loops *= max(rows, 1)
+        else:
+            loops *= math.log2(rows + 1) + 1
+    return loops + subqueries
+
+
+def estimate_query_cost(query: str):
+    # Estimate the rows visited from the EXPLAIN QUERY PLAN tree: a SCAN visits
+    # the whole table and a SEARCH uses an index lookup
+    conn = get_connection()
+    table_rows = get_table_rows(conn)
+    # Aliases and subqueries are not resolved, assume the biggest table
+    default_rows = max(table_rows.values(), default=1)
+
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    children = {}
+    for node_id, parent, _, detail in rows:
+        children.setdefault(parent, []).append((node_id, detail))
+    plan = [row[3] for row in rows]
+    return plan_cost(children, 0, table_rows, default_rows), plan
+
+
+def check_query_plan(query: str, max_cost: float = MAX_QUERY_COST):
+    # Returns the rejection reason, or None when the query may run
+    cost, plan = estimate_query_cost(query)
+    if cost > max_cost:
+        return (
+            f"estimated cost of {cost:,.0f} rows is over the limit of {max_cost:,.0f} "
+            f"(plan: {'; '.join(plan)})"
+        )
+    return None
+
+
+@contextmanager
+def query_timeout(conn, seconds: float):
+    # SQLite calls the progress handler every N VM instructions, a truthy
+    # return value interrupts the running statement
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
     try:
-        # Execute the query and fetch results into a DataFrame
-        df = pd.read_sql_query(query, conn)
+        yield
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+@traced("text2sql.execute")
+def run_sql_query(
+    query: str, max_rows: int = MAX_ROWS, timeout: float = QUERY_TIMEOUT_SECONDS
+):
+    try:
+        rejection = check_query_plan(query)
+        if rejection:
+            return QUERY_REJECTED_PREFIX + rejection
+
+        conn = get_connection()
+        with query_timeout(conn, timeout):
+            cursor = conn.execute(query)
+            try:
+                columns = [column[0] for column in cursor.description or []]
+                # Fetch one extra row to know whether the result was cut off
+                rows = cursor.fetchmany(max_rows + 1)
+            finally:
+                cursor.close()
+
+        df = pd.DataFrame.from_records(rows[:max_rows], columns=columns)
+        df.attrs["truncated"] = len(rows) > max_rows
         return df
+    except sqlite3.OperationalError as e:
+        if str(e) == "interrupted":
+            return f"{QUERY_REJECTED_PREFIX}it ran for more than {timeout}s"
+        return f"Error executing query: {str(e)}"
     except Exception as e:
         return f"Error executing query: {str(e)}"
-    finally:
-        conn.close()
 
 
-def write_answer(question: str, context: str) -> str:
+async def arun_sql_query(query: str, max_rows: int = MAX_ROWS):
+    # sqlite3 is blocking, run the query in a worker thread
+    return await asyncio.to_thread(run_sql_query, query, max_rows)
+
+
+def results_context(df: pd.DataFrame) -> str:
+    # The query results as given to the model, which must know when rows are missing
+    context = df.to_string()
+    if df.attrs.get("truncated"):
+        context += f"\n(Results truncated to the first {len(df)} rows.)"
+    return context
+
+
+def discard_sql_query(question: str, feedback: tuple = None):
+    # Do not serve a query that failed to run from the response cache
+    system_prompt, user_prompt = split_messages(
+        build_sql_query_messages(question, feedback)
+    )
+    llm_cache.discard("gpt-4o-mini", system_prompt, user_prompt)
+
+
+def write_and_run_sql_query(question: str, max_attempts: int = MAX_SQL_ATTEMPTS):
+    start = time.perf_counter()
+    # Fast path: the SQL of an earlier, similar question, without a model call
+    try:
+        with span("text2sql.route"):
+            route = query_router.route(question)
+    except Exception as e:
+        logger.warning(f"Query routing failed: {e}")
+        route = None
+    if route:
+        sql_query, similarity = route
+        query_results = run_sql_query(sql_query)
+        if not isinstance(query_results, str):
+            query_router.record(True, time.perf_counter() - start)
+            explanation = f"Reused the query of a similar question ({similarity:.2f})"
+            return SQLQueryOutput(sql_query=sql_query, explanation=explanation), query_results
+
+    # Write and run the query, feeding rejections back so the model can regenerate it
+    feedback = None
+    # At least one attempt, so both results are always set
+    for _ in range(max(max_attempts, 1)):
+        sql_query_result = write_sql_query(question, feedback)
+        if isinstance(sql_query_result, str):
+            return sql_query_result, sql_query_result
+
+        query_results = run_sql_query(sql_query_result.sql_query)
+        if not isinstance(query_results, str):
+            query_router.learn(question, sql_query_result.sql_query)
+            break
+        discard_sql_query(question, feedback)
+        feedback = (sql_query_result.sql_query, query_results)
+    query_router.record(False, time.perf_counter() - start)
+    return sql_query_result, query_results
+
+
+async def awrite_and_run_sql_query(
+    question: str, max_attempts: int = MAX_SQL_ATTEMPTS
+):
+    start = time.perf_counter()
+    try:
+        with span("text2sql.route"):
+            route = await query_router.aroute(question)
+    except Exception as e:
+        logger.warning(f"Query routing failed: {e}")
+        route = None
+    if route:
+        sql_query, similarity = route
+        query_results = await arun_sql_query(sql_query)
+        if not isinstance(query_results, str):
+            query_router.record(True, time.perf_counter() - start)
+            explanation = f"Reused the query of a similar question ({similarity:.2f})"
+            return SQLQueryOutput(sql_query=sql_query, explanation=explanation), query_results
+
+    feedback = None
+    for _ in range(max(max_attempts, 1)):
+        sql_query_result = await awrite_sql_query(question, feedback)
+        if isinstance(sql_query_result, str):
+            return sql_query_result, sql_query_result
+
+        query_results = await arun_sql_query(sql_query_result.sql_query)
+        if not isinstance(query_results, str):
+            await asyncio.to_thread(
+                query_router.learn, question, sql_query_result.sql_query
+            )
+            break
+        await asyncio.to_thread(discard_sql_query, question, feedback)
+        feedback = (sql_query_result.sql_query, query_results)
+    query_router.record(False, time.perf_counter() - start)
+    return sql_query_result, query_results
+
+
+def build_answer_messages(question: str, context: str) -> list:
 
     SYSTEM_PROMPT = """
         You are a helpful assistant that provides information about the Dabburiya Tech community based on the provided context.
@@ -120,31 +421,61 @@ def write_answer(question: str, context: str) -> str:
             """
 
     USER_PROMPT = USER_PROMPT_TEMPLATE.format(context=context, question=question)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT},
+    ]
+
+
+@traced("text2sql.answer")
+def write_answer(question: str, context: str) -> str:
     try:
-        response = client.chat.completions.create(
+        return cached_completion(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": USER_PROMPT},
-            ],
+            messages=build_answer_messages(question, context),
         )
 
-        return response.choices[0].message.content
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+@traced("text2sql.answer")
+async def awrite_answer(question: str, context: str) -> str:
+    try:
+        return await acached_completion(
+            model="gpt-4o-mini",
+            messages=build_answer_messages(question, context),
+        )
 
     except Exception as e:
         return f"Error: {str(e)}"
 
 
-def write_plotly_figure(question: str, context: str) -> str:
-    def extract_code(content: str) -> str:
-        # Removes the ```python ... ``` wrapper
-        if content.startswith("```"):
-            content = content.strip("`")  # remove ```
-            content = content.split("\n", 1)[1]  # drop 'python' line
-            if content.endswith("```"):
-                content = content.rsplit("\n", 1)[0]
-        return content
+# Streaming variant of write_answer that yields the answer tokens as they arrive
+async def astream_answer(question: str, context: str):
+    try:
+        with span("text2sql.answer"):
+            async for token in astream_cached_completion(
+                model="gpt-4o-mini",
+                messages=build_answer_messages(question, context),
+            ):
+                yield token
+
+    except Exception as e:
+        yield f"Error: {str(e)}"
+
+
+def extract_code(content: str) -> str:
+    # Removes the ```python ... ``` wrapper
+    if content.startswith("```"):
+        content = content.strip("`")  # remove ```
+        content = content.split("\n", 1)[1]  # drop 'python' line
+        if content.endswith("```"):
+            content = content.rsplit("\n", 1)[0]
+    return content
 
+
+def build_plotly_figure_messages(question: str, context: str) -> list:
     SYSTEM_PROMPT = """
         You are a helpful assistant that return Python code that creates a Plotly graph_objects chart based on the provided context.
         The context contains data in tabular format.
@@ -160,41 +491,140 @@ def write_plotly_figure(question: str, context: str) -> str:
             Based on this, provide Python code that uses Plotly graph_objects to create a relevant chart based on the context and question.
             return only the code needed to create the figure object named 'fig' without any additional explanations or text. 
             Directly start with 'import plotly.graph_objects as go' and end with 'fig' object creation, without any extra text before or after.
+            Do not import anything besides plotly, math, statistics, datetime, collections, itertools and json.
             """
 
     USER_PROMPT = USER_PROMPT_TEMPLATE.format(context=context, question=question)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT},
+    ]
+
+
+@traced("text2sql.figure_exec")
+def build_plotly_figure(response_content: str):
+    # The generated code runs in the sandbox pool, never in the app process
+    return figure_sandbox.run(extract_code(response_content))
+
+
+@traced("text2sql.figure_exec")
+async def abuild_plotly_figure(response_content: str):
+    return await figure_sandbox.arun(extract_code(response_content))
+
+
+def fallback_figure(data: pd.DataFrame = None) -> str:
+    # Chart of the query results for when the generated code fails: the first
+    # numeric column by the first text column, else a table of all columns.
+    # Returns None rather than raising, the chart is optional
+    if data is None or data.empty:
+        return None
+    try:
+        numeric = list(data.select_dtypes("number").columns)
+        labels = [column for column in data.columns if column not in numeric]
+        if numeric and labels:
+            fig = go.Figure(
+                data=[
+                    go.Bar(
+                        x=data[labels[0]].astype(str),
+                        y=data[numeric[0]],
+                        name=str(numeric[0]),
+                    )
+                ]
+            )
+        else:
+            fig = go.Figure(
+                data=[
+                    go.Table(
+                        header={"values": [str(column) for column in data.columns]},
+                        cells={"values": [data[column].astype(str) for column in data.columns]},
+                    )
+                ]
+            )
+        return fig.to_json()
+    except Exception as e:
+        logger.warning(f"Could not build the fallback chart: {str(e)}")
+        return None
+
+
+def figure_from_json(figure_json: str):
+    return pio.from_json(figure_json) if figure_json else None
+
+
+@traced("text2sql.figure")
+def write_plotly_figure(question: str, context: str, data: pd.DataFrame = None) -> str:
+    # Returns the figure as JSON, or the fallback chart of `data` if the code fails
     try:
-        response = client.chat.completions.create(
+        response_content = cached_completion(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": USER_PROMPT},
-            ],
+            messages=build_plotly_figure_messages(question, context),
         )
 
-        response_content = response.choices[0].message.content
-        code = extract_code(response_content)
-        local_vars = {}
-        exec(code, {"go": go}, local_vars)
-        fig = local_vars.get("fig")
-        return fig
+        figure_json, error = build_plotly_figure(response_content)
 
     except Exception as e:
-        return None
+        figure_json, error = None, f"Error: {str(e)}"
+
+    if figure_json is None:
+        logger.warning(f"Chart code failed, using the fallback chart. {error}")
+        return fallback_figure(data)
+    return figure_json
+
+
+@traced("text2sql.figure")
+async def awrite_plotly_figure(question: str, context: str, data: pd.DataFrame = None) -> str:
+    try:
+        response_content = await acached_completion(
+            model="gpt-4o-mini",
+            messages=build_plotly_figure_messages(question, context),
+        )
+
+        figure_json, error = await abuild_plotly_figure(response_content)
+
+    except Exception as e:
+        figure_json, error = None, f"Error: {str(e)}"
+
+    if figure_json is None:
+        logger.warning(f"Chart code failed, using the fallback chart. {error}")
+        return fallback_figure(data)
+    return figure_json
+
+
+async def fan_out(jobs: dict):
+    # Run independent jobs concurrently and yield (name, result) as each one finishes
+    tasks = {asyncio.ensure_future(job): name for name, job in jobs.items()}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield tasks[task], task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def write_answer_and_figure(question: str, context: str, data: pd.DataFrame = None):
+    # The answer and the chart only depend on the query results, not on each other
+    return fan_out(
+        {
+            "answer": awrite_answer(question, context),
+            "figure": awrite_plotly_figure(question, context, data),
+        }
+    )
 
 
 if __name__ == "__main__":
     question = "how many members in communit?"
     print(f"\n🔍 User question: {question}")
 
-    # write SQL query
-    sql_query_result = write_sql_query(question)
+    # write and run SQL query
+    sql_query_result, query_results = write_and_run_sql_query(question)
     print(f"💡 Generated SQL Query:\n{sql_query_result.sql_query}")
-
-    # run SQL query
-    sql_query_result = run_sql_query(sql_query_result.sql_query)
-    print(f"💡 SQL Query Results:\n{sql_query_result}")
+    print(f"💡 SQL Query Results:\n{query_results}")
 
     # Generate final answer
-    final_answer = write_answer(question, sql_query_result.to_string())
+    final_answer = write_answer(question, results_context(query_results))
     print(f"💡 Final Answer:\n{final_answer}")
+    print(f"📊 Query routing: {query_router.report()}")
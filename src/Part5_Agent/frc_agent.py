@@ -1,80 +1,173 @@
-import os
 import asyncio
-from dotenv import load_dotenv
-import requests
-from openai import AsyncOpenAI
+from typing import Optional
+from types import SimpleNamespace
+from openai.types.responses import ResponseTextDeltaEvent
 from agents import (
     Agent,
+    ModelSettings,
     Runner,
     function_tool,
     set_default_openai_client,
     set_default_openai_api,
     set_tracing_disabled,
 )
-
-# Load environment variables from .env file
-load_dotenv()
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-TBA_KEY = os.getenv("TBA_KEY")
-
-# os.environ.get("TBA_KEY")  # get your key from your TBA account settings
-headers = {"X-TBA-Auth-Key": TBA_KEY}
+from src.Common.llm_clients import async_client
+from src.Common.llm_cache import llm_cache
+from src.Common.tracing import span, record_tokens
+from src.Part5_Agent.tba_client import async_tba_client
+from src.Part5_Agent.tba_projection import (
+    token_stats,
+    record_savings,
+    project_awards,
+    project_matches,
+    project_match,
+)
 
 
 @function_tool
-def get_awards_by_team(team_id: int):
+async def get_awards_by_team(team_id: int):
     # Get ALL awards for the team by their team number, return event details like event_key of the awards
-    url = f"https://www.thebluealliance.com/api/v3/team/frc{team_id}/awards"
-    awards = requests.get(url, headers=headers).json()
-    return awards
+    awards = await async_tba_client.aget(f"/team/frc{team_id}/awards")
+    projected = project_awards(awards)
+    record_savings("get_awards_by_team", awards, projected)
+    return projected
 
 
 @function_tool
-def get_matches_by_team_and_event(team_id: int, event_key: str):
+async def get_matches_by_team_and_event(team_id: int, event_key: str):
     # Get ALL matches for the team at a specific event including match key, without the points breakdown
-    url = f"https://www.thebluealliance.com/api/v3/team/frc{team_id}/event/{event_key}/matches"
-    matches = requests.get(url, headers=headers).json()
-    for match in matches:
-        match.pop("score_breakdown", None)
-    return matches
+    matches = await async_tba_client.aget(
+        f"/team/frc{team_id}/event/{event_key}/matches"
+    )
+    projected = project_matches(matches)
+    record_savings("get_matches_by_team_and_event", matches, projected)
+    return projected
 
 
 @function_tool
-def get_match_by_key(match_key: str):
-    # Get match details by match key all the points breakdown
-    url = f"https://www.thebluealliance.com/api/v3/match/{match_key}"
-    match = requests.get(url, headers=headers).json()
-    return match
+async def get_match_by_key(match_key: str, breakdown_fields: Optional[list[str]] = None):
+    # Get match details by match key, with the requested points breakdown fields (e.g. autoPoints).
+    # Without breakdown_fields the available field names are listed.
+    match = await async_tba_client.aget(f"/match/{match_key}")
+    projected = project_match(match, breakdown_fields)
+    record_savings("get_match_by_key", match, projected)
+    return projected
 
 
-client = AsyncOpenAI(
-    base_url=OPENAI_API_BASE,
-    api_key=OPENAI_API_KEY,
-)
-set_default_openai_client(client)  # , use_for_tracing=False)
+@function_tool
+async def get_matches_by_keys(
+    match_keys: list[str], breakdown_fields: Optional[list[str]] = None
+):
+    # Get the details of several matches at once, fetched concurrently, with the requested points breakdown fields
+    matches = await asyncio.gather(
+        *(async_tba_client.aget(f"/match/{match_key}") for match_key in match_keys)
+    )
+    projected = project_matches(list(matches), breakdown_fields)
+    record_savings("get_matches_by_keys", matches, projected)
+    return projected
+
+
+set_default_openai_client(async_client.get())  # , use_for_tracing=False)
 set_default_openai_api("chat_completions")
 set_tracing_disabled(disabled=True)
 
 assistant = Agent(
     name="Assistant",
     model="gpt-4o-mini",
-    instructions="You are a helpful assistant for FRC teams.",
-    tools=[get_awards_by_team, get_matches_by_team_and_event, get_match_by_key],
+    instructions=(
+        "You are a helpful assistant for FRC teams. "
+        "When you need several independent lookups, request all the tool calls in the same turn."
+    ),
+    tools=[
+        get_awards_by_team,
+        get_matches_by_team_and_event,
+        get_match_by_key,
+        get_matches_by_keys,
+    ],
+    # Tool calls of the same turn are awaited concurrently by the runner
+    model_settings=ModelSettings(parallel_tool_calls=True),
 )
 
 
+def record_agent_usage(result):
+    # The agents SDK calls the model itself, its usage comes with the run result
+    usage = result.context_wrapper.usage
+    record_tokens(usage.input_tokens, usage.output_tokens)
+
+
 def run_frc_agent(question: str):
-    result = Runner.run_sync(
-        assistant,
-        question,
+    cached, embedding = llm_cache.get(
+        assistant.model, assistant.instructions, question
+    )
+    if cached is not None:
+        # Only the final output is kept for cached answers
+        return SimpleNamespace(final_output=cached)
+
+    with span("frc.agent"):
+        result = Runner.run_sync(
+            assistant,
+            question,
+        )
+        record_agent_usage(result)
+    llm_cache.set(
+        assistant.model, assistant.instructions, question, result.final_output, embedding
+    )
+    return result
+
+
+# Async variant of run_frc_agent to be awaited from a running event loop
+async def arun_frc_agent(question: str):
+    cached, embedding = await llm_cache.aget(
+        assistant.model, assistant.instructions, question
+    )
+    if cached is not None:
+        return SimpleNamespace(final_output=cached)
+
+    with span("frc.agent"):
+        result = await Runner.run(
+            assistant,
+            question,
+        )
+        record_agent_usage(result)
+    await llm_cache.aset(
+        assistant.model, assistant.instructions, question, result.final_output, embedding
     )
     return result
 
 
+# Streaming variant of arun_frc_agent that yields the final answer tokens
+async def astream_frc_agent(question: str):
+    cached, embedding = await llm_cache.aget(
+        assistant.model, assistant.instructions, question
+    )
+    if cached is not None:
+        yield cached
+        return
+
+    with span("frc.agent"):
+        result = Runner.run_streamed(
+            assistant,
+            question,
+        )
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and isinstance(
+                event.data, ResponseTextDeltaEvent
+            ):
+                yield event.data.delta
+        record_agent_usage(result)
+    await llm_cache.aset(
+        assistant.model, assistant.instructions, question, result.final_output, embedding
+    )
+
+
 if __name__ == "__main__":
     question = "How many match points in auto mode of the last match when team 5715 won their last championship award?"
     print(f"\n🔍 User question: {question}")
 
     result = run_frc_agent(question)
     print(f"\n💡 Agent response: {result.final_output}")
+    print(
+        f"📊 TBA cache stats: {async_tba_client.stats}, "
+        f"hit rate {async_tba_client.hit_rate():.0%}"
+    )
+    print(f"📊 Tool output tokens (raw vs projected): {dict(token_stats)}")
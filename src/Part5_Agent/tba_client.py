@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from src.Common.tracing import span, annotate
+
+# Load environment variables from .env file
+load_dotenv()
+TBA_KEY = os.getenv("TBA_KEY")
+TBA_API_BASE = os.getenv("TBA_API_BASE", "https://www.thebluealliance.com/api/v3")
+
+source_dir = Path(__file__).resolve().parent.parent.parent
+TBA_CACHE_DB_PATH = os.path.join(source_dir, "data/tba_cache.db")
+
+# Single match endpoint, its response never changes once the match has been played
+MATCH_PATH_PATTERN = re.compile(r"^/match/[^/]+$")
+
+
+def parse_max_age(cache_control: str) -> int:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return int(match.group(1)) if match else 0
+
+
+def is_finished_match(match) -> bool:
+    # Unplayed matches have no result time and a score of -1
+    if not isinstance(match, dict) or "alliances" not in match:
+        return False
+    scores = [alliance.get("score", -1) for alliance in match["alliances"].values()]
+    return bool(match.get("post_result_time")) and all(s >= 0 for s in scores)
+
+
+class TBAResponseCache:
+    """
+    On-disk cache of The Blue Alliance API responses, stored on local SQLite.
+
+    Each entry keeps the response body, its `ETag` and the expiry derived from
+    `Cache-Control: max-age`. Expired entries are revalidated with
+    `If-None-Match`; entries marked `permanent` (finished matches) never expire.
+    """
+
+    def __init__(self, db_path: str = TBA_CACHE_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tba_cache (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    body TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    permanent INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+        return self._conn
+
+    def get(self, url: str):
+        with self._lock:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT etag, body, expires_at, permanent FROM tba_cache WHERE url = ?",
+                    (url,),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        etag, body, expires_at, permanent = row
+        return {
+            "etag": etag,
+            "body": body,
+            "expires_at": expires_at,
+            "permanent": bool(permanent),
+        }
+
+    def set(self, url: str, etag, body: str, expires_at: float, permanent: bool):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO tba_cache (url, etag, body, expires_at, permanent)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (url, etag, body, expires_at, int(permanent)),
+            )
+            conn.commit()
+
+    def touch(self, url: str, expires_at: float):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE tba_cache SET expires_at = ? WHERE url = ?", (expires_at, url)
+            )
+            conn.commit()
+
+
+class TBAClient:
+    """
+    The Blue Alliance API client with a pooled keep-alive session and a response cache.
+
+    `stats` counts fresh cache hits, revalidated responses (304 Not Modified) and
+    misses that downloaded a new body.
+    """
+
+    def __init__(
+        self,
+        api_base: str = TBA_API_BASE,
+        api_key: str = TBA_KEY,
+        cache: TBAResponseCache = None,
+        timeout: float = 10.0,
+    ):
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key or ""
+        self.timeout = timeout
+        self.cache = cache or TBAResponseCache()
+        self.session = requests.Session()
+        self.session.headers.update({"X-TBA-Auth-Key": self.api_key})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0}
+
+    def hit_rate(self) -> float:
+        hits = self.stats["hits"] + self.stats["revalidated"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _lookup(self, url: str):
+        # Returns the cache entry and, when it is still fresh, its payload
+        entry = self.cache.get(url)
+        if entry and (entry["permanent"] or entry["expires_at"] > time.time()):
+            self.stats["hits"] += 1
+            annotate(cache_hit=True)
+            return entry, json.loads(entry["body"])
+        return entry, None
+
+    def _conditional_headers(self, entry) -> dict:
+        if entry and entry["etag"]:
+            return {"If-None-Match": entry["etag"]}
+        return {}
+
+    def _handle_response(self, path, url, entry, status_code, headers, text):
+        max_age = parse_max_age(headers.get("Cache-Control"))
+
+        if status_code == 304 and entry:
+            self.stats["revalidated"] += 1
+            annotate(cache_hit="revalidated")
+            self.cache.touch(url, time.time() + max_age)
+            return json.loads(entry["body"])
+
+        self.stats["misses"] += 1
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            # Error pages (or a 304 without a cached entry) have no JSON body,
+            # passed on as a TBA style error for the model
+            return {"Errors": [{"status": status_code, "body": text[:200]}]}
+        if status_code == 200:
+            self.cache.set(
+                url,
+                headers.get("ETag"),
+                text,
+                time.time() + max_age,
+                permanent=bool(MATCH_PATH_PATTERN.match(path))
+                and is_finished_match(payload),
+            )
+        return payload
+
+    def get(self, path: str):
+        with span("frc.tba_get", path=path):
+            url = f"{self.api_base}{path}"
+            entry, payload = self._lookup(url)
+            if payload is not None:
+                return payload
+
+            response = self.session.get(
+                url, headers=self._conditional_headers(entry), timeout=self.timeout
+            )
+            return self._handle_response(
+                path, url, entry, response.status_code, response.headers, response.text
+            )
+
+
+class AsyncTBAClient(TBAClient):
+    """
+    Async variant of `TBAClient` on a pooled `httpx.AsyncClient`.
+
+    At most `max_concurrency` requests are in flight at once, so tool calls that
+    the agent fans out in parallel do not flood the API. It shares the on-disk
+    response cache with the sync client and uses it from a worker thread.
+    """
+
+    def __init__(self, *args, max_concurrency: int = 8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Created per event loop, pooled connections cannot be shared between loops
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                headers={"X-TBA-Auth-Key": self.api_key},
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aget(self, path: str):
+        with span("frc.tba_get", path=path):
+            url = f"{self.api_base}{path}"
+            # The cache is on SQLite, read and written in a worker thread
+            entry, payload = await asyncio.to_thread(self._lookup, url)
+            if payload is not None:
+                return payload
+
+            client = self._async_client()
+            async with self._semaphore:
+                response = await client.get(url, headers=self._conditional_headers(entry))
+            return await asyncio.to_thread(
+                self._handle_response,
+                path,
+                url,
+                entry,
+                response.status_code,
+                response.headers,
+                response.text,
+            )
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._loop = self._client = self._semaphore = None
+
+
+tba_client = TBAClient()
+async_tba_client = AsyncTBAClient(cache=tba_client.cache)
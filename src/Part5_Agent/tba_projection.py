@@ -0,0 +1,123 @@
+import json
+import logging
+from collections import defaultdict
+from src.Common.token_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Declarative projections of the TBA payloads: output column -> dotted source path.
+# Only these fields reach the model, everything else is dropped.
+AWARD_FIELDS = {
+    "name": "name",
+    "award_type": "award_type",
+    "event_key": "event_key",
+    "year": "year",
+}
+
+MATCH_FIELDS = {
+    "key": "key",
+    "comp_level": "comp_level",
+    "set": "set_number",
+    "match": "match_number",
+    "time": "actual_time",
+    "winner": "winning_alliance",
+    "red_score": "alliances.red.score",
+    "blue_score": "alliances.blue.score",
+    "red_teams": "alliances.red.team_keys",
+    "blue_teams": "alliances.blue.team_keys",
+}
+
+ALLIANCES = ["red", "blue"]
+
+# Tokens of the raw payloads vs the projected tool outputs, per tool
+token_stats = defaultdict(lambda: {"calls": 0, "raw_tokens": 0, "projected_tokens": 0})
+
+
+def get_path(record: dict, path: str):
+    value = record
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def project(record: dict, fields: dict) -> dict:
+    return {name: get_path(record, path) for name, path in fields.items()}
+
+
+def project_breakdown(match: dict, breakdown_fields: list) -> dict:
+    # Pick the requested score breakdown fields (e.g. autoPoints) for each alliance
+    breakdown = match.get("score_breakdown") or {}
+    return {
+        f"{alliance}_{field}": (breakdown.get(alliance) or {}).get(field)
+        for alliance in ALLIANCES
+        for field in breakdown_fields
+    }
+
+
+def breakdown_field_names(match: dict) -> list:
+    breakdown = match.get("score_breakdown") or {}
+    return sorted((breakdown.get("red") or {}).keys())
+
+
+def format_value(value) -> str:
+    if isinstance(value, list):
+        # Team keys are the most common lists, "frc254" -> "254"
+        return " ".join(str(v).removeprefix("frc") for v in value)
+    return "" if value is None else str(value)
+
+
+def to_compact_table(records: list) -> str:
+    # Pipe separated table, the column names are written once instead of per record
+    if not records:
+        return "(no results)"
+    columns = list(records[0].keys())
+    lines = ["|".join(columns)]
+    for record in records:
+        lines.append("|".join(format_value(record.get(c)) for c in columns))
+    return "\n".join(lines)
+
+
+def record_savings(tool_name: str, raw_payload, projected: str):
+    raw_tokens = count_tokens(json.dumps(raw_payload))
+    projected_tokens = count_tokens(projected)
+    stats = token_stats[tool_name]
+    stats["calls"] += 1
+    stats["raw_tokens"] += raw_tokens
+    stats["projected_tokens"] += projected_tokens
+    logger.info(
+        f"{tool_name}: {raw_tokens} -> {projected_tokens} tokens "
+        f"({raw_tokens - projected_tokens} saved)"
+    )
+
+
+def project_awards(awards) -> str:
+    if not isinstance(awards, list):
+        # TBA errors come back as a dict, pass them through for the model
+        return json.dumps(awards)
+    return to_compact_table([project(award, AWARD_FIELDS) for award in awards])
+
+
+def project_matches(matches, breakdown_fields: list = None) -> str:
+    if not isinstance(matches, list):
+        return json.dumps(matches)
+    records = []
+    for match in sorted(matches, key=lambda m: m.get("time") or 0):
+        record = project(match, MATCH_FIELDS)
+        if breakdown_fields:
+            record.update(project_breakdown(match, breakdown_fields))
+        records.append(record)
+    return to_compact_table(records)
+
+
+def project_match(match, breakdown_fields: list = None) -> str:
+    if not isinstance(match, dict) or "key" not in match:
+        return json.dumps(match)
+    record = project(match, MATCH_FIELDS)
+    if breakdown_fields:
+        record.update(project_breakdown(match, breakdown_fields))
+    else:
+        # Tell the model which breakdown fields it can ask for
+        record["breakdown_fields"] = breakdown_field_names(match)
+    return json.dumps(record, separators=(",", ":"))
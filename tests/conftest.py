@@ -0,0 +1,25 @@
+import pytest
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from benchmarks.fake_tba_server import FakeTBAServer
+from benchmarks.parts_benchmark import configure
+
+# The parts read OPENAI_API_BASE and TBA_API_BASE when they are imported, so tests
+# that use the shared clients import the parts inside the test, after `fake_apis`
+
+
+@pytest.fixture(scope="session")
+def fake_apis():
+    openai_server = FakeOpenAIServer(latency=0.3, completion_tokens=5).start()
+    tba_server = FakeTBAServer(latency=0.05).start()
+    configure(openai_server, tba_server)
+    yield openai_server, tba_server
+    openai_server.stop()
+    tba_server.stop()
+
+
+@pytest.fixture
+def tba_server():
+    # Responses expire right away, so a second request has to be revalidated
+    server = FakeTBAServer(latency=0.2, max_age=0).start()
+    yield server
+    server.stop()
@@ -0,0 +1,63 @@
+import time
+import asyncio
+
+SESSIONS = 8
+
+
+def test_simultaneous_sessions_finish_in_one_latency(fake_apis):
+    from src.Part1_Simple_LLM.simple_llm_chat import arun_chat
+
+    async def ask(count):
+        start = time.perf_counter()
+        answers = await asyncio.gather(
+            *(arun_chat(f"question {i}") for i in range(count))
+        )
+        return answers, time.perf_counter() - start
+
+    # The first question also creates the shared client
+    _, single = asyncio.run(ask(1))
+    answers, elapsed = asyncio.run(ask(SESSIONS))
+
+    assert not any(answer.startswith("Error") for answer in answers)
+    # Blocking calls would take about SESSIONS times as long
+    assert elapsed < 3 * single
+
+
+def test_streamed_answer_records_usage(fake_apis):
+    from src.Common.llm_clients import usage_stats, usage_scope
+    from src.Part1_Simple_LLM.simple_llm_chat import astream_chat
+
+    async def stream():
+        with usage_scope() as usage:
+            tokens = [token async for token in astream_chat("a streamed question")]
+        return tokens, usage
+
+    requests = usage_stats["gpt-4o-mini"]["requests"]
+    tokens, usage = asyncio.run(stream())
+
+    assert tokens
+    assert usage["requests"] == 1
+    assert usage["prompt_tokens"] > 0 and usage["completion_tokens"] > 0
+    assert usage_stats["gpt-4o-mini"]["requests"] == requests + 1
+
+
+def test_fan_out_yields_jobs_as_they_finish(fake_apis):
+    from src.Part4_Text2SQL.text_to_sql_chat import fan_out
+
+    async def job(name, seconds):
+        await asyncio.sleep(seconds)
+        return name
+
+    async def collect():
+        start = time.perf_counter()
+        results = [
+            (name, result, time.perf_counter() - start)
+            async for name, result in fan_out({"slow": job("slow", 0.4), "fast": job("fast", 0.1)})
+        ]
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(collect())
+
+    assert [(name, result) for name, result, _ in results] == [("fast", "fast"), ("slow", "slow")]
+    assert results[0][2] < 0.3
+    assert elapsed < 0.6
@@ -0,0 +1,39 @@
+import pytest
+
+COUNT = "SELECT COUNT(*) FROM members"
+
+
+@pytest.fixture
+def text2sql(fake_apis):
+    from src.Part4_Text2SQL import text_to_sql_chat
+
+    return text_to_sql_chat
+
+
+def test_union_parts_add_up(text2sql):
+    members = text2sql.get_table_rows(text2sql.get_connection())["members"]
+    cost, _ = text2sql.estimate_query_cost(" UNION ALL ".join([COUNT] * 4))
+
+    assert cost < 5 * members
+    assert text2sql.check_query_plan(" UNION ALL ".join([COUNT] * 4)) is None
+
+
+def test_scalar_subqueries_add_up(text2sql):
+    members = text2sql.get_table_rows(text2sql.get_connection())["members"]
+    query = "SELECT " + ", ".join([f"({COUNT})"] * 4)
+    cost, _ = text2sql.estimate_query_cost(query)
+
+    assert cost < 5 * members
+    assert text2sql.check_query_plan(query) is None
+
+
+def test_nested_loops_multiply(text2sql):
+    members = text2sql.get_table_rows(text2sql.get_connection())["members"]
+    cost, _ = text2sql.estimate_query_cost(
+        "SELECT * FROM members a, members b, members c"
+    )
+
+    assert cost >= members**3
+    assert text2sql.check_query_plan(
+        "SELECT * FROM members a, members b, members c, members d"
+    )
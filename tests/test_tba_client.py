@@ -0,0 +1,91 @@
+import time
+import asyncio
+from benchmarks.fake_tba_server import TEAM_NUMBER, EVENT_KEY, make_match
+from src.Part5_Agent.tba_client import TBAClient, AsyncTBAClient, TBAResponseCache
+
+
+def make_client(server, tmp_path, client_class=TBAClient, **kwargs):
+    cache = TBAResponseCache(str(tmp_path / "tba_cache.db"))
+    return client_class(api_base=server.base_url, api_key="test", cache=cache, **kwargs)
+
+
+def test_expired_response_is_revalidated_with_etag(tba_server, tmp_path):
+    client = make_client(tba_server, tmp_path)
+    path = f"/team/frc{TEAM_NUMBER}/awards"
+
+    first = client.get(path)
+    second = client.get(path)
+
+    assert second == first
+    assert tba_server.stats == {"requests": 2, "not_modified": 1}
+    assert client.stats == {"hits": 0, "revalidated": 1, "misses": 1}
+
+
+def test_finished_match_is_kept_without_revalidation(tba_server, tmp_path):
+    client = make_client(tba_server, tmp_path)
+    path = f"/match/{EVENT_KEY}_qm1"
+
+    first = client.get(path)
+    second = client.get(path)
+
+    assert second == first
+    assert client.cache.get(client.api_base + path)["permanent"]
+    assert tba_server.stats["requests"] == 1
+    assert client.stats == {"hits": 1, "revalidated": 0, "misses": 1}
+
+
+def test_unplayed_match_is_not_permanent(tba_server, tmp_path):
+    tba_server.routes[f"/match/{EVENT_KEY}_qm99"] = make_match(99, finished=False)
+    client = make_client(tba_server, tmp_path)
+    path = f"/match/{EVENT_KEY}_qm99"
+
+    client.get(path)
+    client.get(path)
+
+    assert not client.cache.get(client.api_base + path)["permanent"]
+    assert tba_server.stats == {"requests": 2, "not_modified": 1}
+
+
+def test_async_fan_out_runs_requests_concurrently(tba_server, tmp_path):
+    client = make_client(tba_server, tmp_path, AsyncTBAClient, max_concurrency=8)
+    paths = [f"/match/{EVENT_KEY}_qm{i}" for i in range(1, 7)]
+
+    async def fan_out():
+        start = time.perf_counter()
+        matches = await asyncio.gather(*(client.aget(path) for path in paths))
+        elapsed = time.perf_counter() - start
+        await client.aclose()
+        return matches, elapsed
+
+    matches, elapsed = asyncio.run(fan_out())
+
+    assert [match["key"] for match in matches] == [path.split("/")[-1] for path in paths]
+    # Six requests of 0.2s each, about one latency when they run together
+    assert elapsed < 0.6
+
+
+def test_async_client_bounds_requests_in_flight(tba_server, tmp_path):
+    client = make_client(tba_server, tmp_path, AsyncTBAClient, max_concurrency=2)
+    paths = [f"/match/{EVENT_KEY}_qm{i}" for i in range(1, 7)]
+
+    async def fan_out():
+        start = time.perf_counter()
+        await asyncio.gather(*(client.aget(path) for path in paths))
+        elapsed = time.perf_counter() - start
+        await client.aclose()
+        return elapsed
+
+    # Two at a time, so at least three latencies of 0.2s
+    assert asyncio.run(fan_out()) >= 0.6
+
+
+def test_error_without_json_body_is_returned_as_error(tba_server, tmp_path):
+    client = make_client(tba_server, tmp_path)
+    url = client.api_base + "/team/frc1/awards"
+
+    bad_gateway = client._handle_response("/team/frc1/awards", url, None, 502, {}, "<html>Bad gateway</html>")
+    not_modified = client._handle_response("/team/frc1/awards", url, None, 304, {}, "")
+
+    assert bad_gateway["Errors"][0]["status"] == 502
+    assert not_modified["Errors"][0]["status"] == 304
+    assert client.cache.get(url) is None